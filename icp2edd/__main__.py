@@ -4,6 +4,7 @@
 
 # ----------------------------------------------
 # import from standard lib
+import itertools
 import logging
 from pathlib import Path
 from time import localtime, strftime
@@ -14,9 +15,12 @@ import icp2edd.csv4Erddap as c4edd
 import icp2edd.parameters as parameters
 import icp2edd.setupcfg as setupcfg
 import icp2edd.timing
+import icp2edd.util as util
 import icp2edd.xml4Erddap as x4edd
+from icp2edd.downloader import DataStore
 from icp2edd.icpobj import *  # see icpobj/__init__.py
 from icp2edd.superIcpObj import SuperICPObj
+from icp2edd.supersession import Supersession
 
 
 # ----------------------------------------------
@@ -59,23 +63,63 @@ def main():
 
     _logger.info("download DataObject from ICOS-CP")
     try:
-        dd = dataobjs.download()
+        # Note: files are downloaded newest, and smallest first, in the background
+        dd = dataobjs.iterDownload()
     except Exception:
         _logger.exception("Something goes wrong when downloading DataObject data")
         raise  # Throw exception again so calling code knows it happened
 
-    # loop on each dataset downloaded
-    for csv, rep in dd.items():
+    # loop on each dataset, as soon as downloaded
+    # Note: csv files are changed, dataset.xml generated, and published, while others keep
+    # downloading, ICOS CP metadata are added once every file is done (see step 2)
+    filenames = []
 
+    def _downloaded():
+        """ """
+        for csv, rep in dd:
+            filenames.append(csv)
+            yield Path.joinpath(rep, csv)
+
+    if setupcfg.downloadTransform:
+        # Note: csv file already changed while downloading, rows order unknown
+        modified = ((fileout, None, None) for fileout in _downloaded())
+    else:
         _logger.info(
             "change in csv file :\n\t\t- change Date/Time format\n\t\t- remove units for variable name"
         )
+        modified = c4edd.modifyAll(
+            _downloaded(),
+            setupcfg.transformWorkers,
+            chunksize_=setupcfg.transformChunksize,
+            passthrough_=setupcfg.transformPassthrough,
+            engine_=setupcfg.transformEngine,
+            stats_=setupcfg.transformStats,
+        )
+
+    failed = []
+    for fileout, ordered, error in modified:
+        if error is not None:
+            _logger.error(
+                f"Something goes wrong when modifying csv file {fileout}\n{error}"
+            )
+            failed.append(fileout)
+            continue
+
         try:
-            fileout = Path.joinpath(rep, csv)
-            c4edd.modify(fileout)
+            # Note: sorted by Date/Time before partition, see Xml4Erddap
+            c4edd.sort(fileout, setupcfg.transformChunksize, ordered)
+
+            if setupcfg.transformPartition is not None:
+                c4edd.partition(
+                    fileout, setupcfg.transformPartition, setupcfg.transformChunksize
+                )
+            else:
+                # Note: partitions of a previous run would duplicate rows
+                c4edd.removePartitions(fileout)
         except Exception:
-            _logger.exception("Something goes wrong when modifying csv file")
-            raise  # Throw exception again so calling code knows it happened
+            _logger.exception(f"Something goes wrong when sorting csv file {fileout}")
+            failed.append(fileout)
+            continue
 
         _logger.info("run ERDDAP GenerateDatasetXml tool to create dataset.xml file")
         try:
@@ -96,6 +140,53 @@ def main():
             )
             raise  # Throw exception again so calling code knows it happened
 
+        # serve dataset without waiting for the others
+        try:
+            x4edd.publish(dirout.stem)
+        except Exception:
+            _logger.exception("Something goes wrong when publishing ERDDAP dataset")
+            raise  # Throw exception again so calling code knows it happened
+
+    if failed:
+        # Note: every other file was modified, and its dataset.xml generated
+        _logger.error(
+            f"skip {len(failed)} csv file(s) which can not be modified: {failed}"
+        )
+        # Note: raw files, and their former dataset.xml, must not be published
+        for fileout in failed:
+            c4edd.setAside(fileout)
+        for dirout in sorted({fileout.parent for fileout in failed}):
+            try:
+                if any(dirout.glob("*.csv")):
+                    # dataset.xml could have been generated from a raw file
+                    x4edd.Xml4Erddap(dirout).generate()
+                else:
+                    x4edd.remove(dirout.stem)
+                x4edd.publish(dirout.stem)
+            except Exception:
+                _logger.exception(
+                    f"Something goes wrong when removing failed files from {dirout}"
+                )
+                raise  # Throw exception again so calling code knows it happened
+
+    if setupcfg.lastversion:
+        _logger.info("retire dataset(s) superseded by a new version")
+        try:
+            sup = Supersession()
+            sup.map(list(dataobjs.meta))
+            sup.retire(filenames)
+        except Exception:
+            _logger.exception("Something goes wrong when retiring previous versions")
+            raise  # Throw exception again so calling code knows it happened
+
+    if setupcfg.downloadStore is not None:
+        # Note: files of datasets retired, or downloaded again, are no longer referenced
+        try:
+            DataStore(setupcfg.downloadStore).evict(setupcfg.datasetCsvPath)
+        except Exception:
+            _logger.exception("Something goes wrong when evicting files from store")
+            raise  # Throw exception again so calling code knows it happened
+
     _logger.info("concatenate every dataset file(s) into one")
     # concatenate header.xml dataset.XXX.xml footer.xml into local datasets.xml
     dsxmlout = x4edd.concatenate()
@@ -117,16 +208,37 @@ def main():
     try:
         _logger.info(f"initialise SuperICPObj object")
         superObj = SuperICPObj()
-        gloatt = superObj.getAttr()
-        superObj.show()
+        if setupcfg.streamBatch is None:
+            gloatt = superObj.getAttr()
+            superObj.show()
+            superObj.close()
+        else:
+            # crawl and repack DataObjects, a batch at a time, while changing attributes
+            gloatt = superObj.iterAttr(setupcfg.streamBatch)
 
     except Exception:
         _logger.exception("Something goes wrong when initialising SuperICPObj")
         raise  # Throw exception again so calling code knows it happened
 
+    if setupcfg.transformStats:
+        # add statistics of csv columns {datasetID: {attname: [value]}}
+        statatt = {}
+        for dirout in sorted(setupcfg.datasetCsvPath.iterdir()):
+            if dirout.is_dir():
+                att = c4edd.datasetAttributes(dirout)
+                if att:
+                    statatt[util.datasetidCase(dirout.stem)] = att
+        if isinstance(gloatt, dict):
+            gloatt = [gloatt]
+        # Note: added last, see 'keep' in parameters file
+        gloatt = itertools.chain(gloatt, [statatt])
+
     try:
         _logger.info("change/add attributes into local datasets.xml")
         x4edd.changeAttr(dsxmlout, gloatt)
+        if setupcfg.streamBatch is not None:
+            superObj.show()
+            superObj.close()
         _logger.info("replace ERDDAP datasets.xml file with the new one")
         x4edd.replaceXmlBy(dsxmlout)
 
@@ -136,6 +248,10 @@ def main():
         )
         raise  # Throw exception again so calling code knows it happened
 
+    if failed:
+        # Note: ending submitted date is not stored, so that next run tries them again
+        raise RuntimeError(f"Can not modify csv file(s): {failed}")
+
     # store ending submitted date of current update
     setupcfg.add_last_subm()
 
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# crawlPolicy.py
+
+"""
+    This module set up the crawl policy, used to prune the exploration of ICOS CP objects.
+
+    Rules are read from the parameters file (see 'crawl' in parameters.yaml).
+    They apply both to the properties requested from ICOS CP (SPARQL OPTIONAL),
+    and to the objects explored from there.
+
+    Example usage:
+
+    from crawlPolicy import CrawlPolicy
+
+    policy = CrawlPolicy(param["crawl"])                # initialise crawl policy
+    keep, prune = policy.query(objtype)                 # properties to (not) request
+    follow, rules = policy.follow(objtype, attr, rules) # follow attribute or not
+    mode = policy.predicate(attr)                       # 'follow', 'uri' or 'ignore'
+    policy.cycle(path, attr)                            # record cycle found
+    policy.report()                                     # log how much each rule saves, and cycles found
+"""
+
+# --- import -----------------------------------
+# import from standard lib
+import logging
+
+# import from other lib
+# import from my project
+import icp2edd.icpobj as icpobj
+import icp2edd.util as util
+
+# --- module's variable ------------------------
+# load logger
+_logger = logging.getLogger(__name__)
+
+# properties always requested, as needed by icp2edd
+# Warning: linked to:
+# - 'cpmeta:hasName' in StaticObject
+# - 'cpmeta:hasColumnTitle' in DatasetColumn
+_required = {"cpmeta:hasName", "cpmeta:hasColumnTitle"}
+
+# list of attributes to not dig in to avoid infinity loop / recursive search
+# Warning: linked to:
+# - 'cpmeta:isNextVersionOf'  in StaticObject, and Collection
+# - 'cpmeta:isQualityFlagFor' in DatasetColumn
+# - 'prov:hadPrimarySource'   in StaticObject, and Collection
+# - 'prov:wasRevisionOf'      in StaticObject, and Collection
+list_rec_search = ["NextVersionOf", "RevisionOf", "PrimarySource", "QualityFlagFor"]
+
+# how to handle link of an attribute
+# - follow: explore object pointed to, and spread its attributes
+# - uri: keep uri of object pointed to as attribute value, do not explore it
+# - ignore: do not explore object pointed to, nor keep it
+list_predicate_mode = ["follow", "uri", "ignore"]
+
+# number of cycles shown per attribute in report
+_cycle_shown = 3
+
+
+# ----------------------------------------------
+class CrawlPolicy(object):
+    """ """
+
+    def __init__(self, crawl_=None):
+        """initialise crawl policy.
+
+        rules are given per class, and apply to its subclasses too.
+        a rule is a path of predicates separated by '/', starting from the class:
+        - exclude: last predicate of the path is not requested, nor explored,
+          except properties needed by icp2edd (see _required)
+        - include: only predicates of the path are requested, and explored
+
+        Example:
+            CrawlPolicy({'depth': 4,
+                         'rules': {'cpmeta.DataObject': {'exclude': ['cpmeta:wasSubmittedBy/prov:wasAssociatedWith']}},
+                         'predicates': {'RevisionOf': 'uri'}})
+
+        :param crawl_: dictionary {'depth': maximum depth,
+                                   'rules': {objtype: {'include': [path, ...], 'exclude': [path, ...]}},
+                                   'predicates': {attribute: mode, ...}}
+        """
+        if crawl_ is None:
+            crawl_ = {}
+
+        self.depth = crawl_.get("depth")
+        # rules (id, mode, tuple of predicates) per class
+        # Note: include rules of a class work together, so they share the same id
+        self._rules = {}
+        for objtype, modes in crawl_.get("rules", {}).items():
+            for path in modes.get("include", []):
+                rule = (f"{objtype} include", "include", tuple(path.split("/")))
+                self._rules.setdefault(objtype, []).append(rule)
+            for path in modes.get("exclude", []):
+                if path.split("/")[-1] in _required:
+                    _logger.warning(
+                        f"ignore crawl rule {objtype} exclude {path}, "
+                        f"properties {sorted(_required)} are needed by icp2edd"
+                    )
+                    continue
+                rule = (f"{objtype} exclude {path}", "exclude", tuple(path.split("/")))
+                self._rules.setdefault(objtype, []).append(rule)
+
+        # link mode per attribute, attributes of list_rec_search are ignored by default
+        self._predicates = {k: "ignore" for k in list_rec_search}
+        self._predicates.update(crawl_.get("predicates", {}))
+
+        # rules per object type, including rules of parent classes
+        self._typeRules = {}
+        # attribute name to predicates, per object type
+        self._typePred = {}
+        # saved crawl volume per rule
+        self.saved = {}
+        # cycles found {attribute closing the cycle: {cycle: None, ...}}
+        self.cycles = {}
+
+    def _save(self, ruleid_, key_, n_=1):
+        """count crawl volume saved by rule"""
+        _ = self.saved.setdefault(ruleid_, {"optional": 0, "edge": 0, "object": set()})
+        if key_ == "object":
+            _[key_].update(n_)
+        else:
+            _[key_] += n_
+
+    def _getRules(self, objtype_):
+        """return rules of object type, and of its parent classes"""
+        if objtype_ not in self._typeRules:
+            rules = []
+            klass = vars(icpobj).get(objtype_)
+            if klass is not None:
+                # Note: last class is 'object'
+                for k in klass.__mro__[:-1]:
+                    rules.extend(self._rules.get(util.classKey(k), []))
+            self._typeRules[objtype_] = rules
+        return self._typeRules[objtype_]
+
+    def _getPred(self, objtype_):
+        """return dictionary {attribute name: {predicate, ...}} of object type"""
+        if objtype_ not in self._typePred:
+            pred = {}
+            klass = vars(icpobj).get(objtype_)
+            if klass is not None:
+                inst = klass()
+                # merge properties of equivalent class, as done when querying
+                inst._queryString()
+                for k, v in inst.attr.items():
+                    pred.setdefault(v, set()).add(k)
+            self._typePred[objtype_] = pred
+        return self._typePred[objtype_]
+
+    def query(self, objtype_):
+        """return predicates to be requested (None if all), and predicates not to be requested,
+        for object type objtype_.
+
+        Note: only rules of the class apply here, as an object is requested only once,
+        whatever the path used to reach it.
+
+        :return: (keep, prune)
+        """
+        rules = self._getRules(objtype_)
+        keep = None
+        include = [r for r in rules if r[1] == "include"]
+        if include:
+            keep = {r[2][0] for r in include} | _required
+        prune = {r[2][0] for r in rules if r[1] == "exclude" and len(r[2]) == 1}
+        return keep, prune
+
+    def countQuery(self, objtype_, predicates_):
+        """count OPTIONAL not requested, for each rule, when querying object of type objtype_
+
+        :param predicates_: predicates of the object type
+        """
+        rules = self._getRules(objtype_)
+        include = {r[0] for r in rules if r[1] == "include"}
+        keep, prune = self.query(objtype_)
+        for p in predicates_:
+            for r in rules:
+                if r[1] == "exclude" and r[2] == (p,):
+                    self._save(r[0], "optional")
+            if keep is not None and p not in keep:
+                for ruleid in include:
+                    self._save(ruleid, "optional")
+
+    def follow(self, objtype_, attr_, rules_=(), uri_=None):
+        """check if attribute attr_ of object type objtype_ should be explored
+
+        :param objtype_: object type ('cpmeta.DataObject')
+        :param attr_: attribute name ('station')
+        :param rules_: rules inherited from the path used to reach this object
+        :param uri_: uri pointed to by attribute
+        :return: (follow, rules to pass to object pointed to)
+        """
+        rules = [*rules_, *self._getRules(objtype_)]
+        if not rules:
+            return True, ()
+
+        preds = self._getPred(objtype_).get(attr_, {attr_})
+
+        include = [r for r in rules if r[1] == "include"]
+        if include and not any(r[2][0] in preds for r in include):
+            for ruleid in {r[0] for r in include}:
+                self._save(ruleid, "edge")
+                self._save(ruleid, "object", {uri_})
+            return False, ()
+
+        for r in rules:
+            if r[1] == "exclude" and len(r[2]) == 1 and r[2][0] in preds:
+                self._save(r[0], "edge")
+                self._save(r[0], "object", {uri_})
+                return False, ()
+
+        return True, tuple(
+            (r[0], r[1], r[2][1:]) for r in rules if len(r[2]) > 1 and r[2][0] in preds
+        )
+
+    def predicate(self, attr_):
+        """return link mode of attribute attr_ ('follow', 'uri' or 'ignore')"""
+        return self._predicates.get(attr_, "follow")
+
+    def cycle(self, path_, attr_):
+        """record cycle found while exploring, or spreading, objects
+
+        :param path_: list of uri [uri, ..., uri], first and last uri are the same
+        :param attr_: attribute name pointing from the last but one uri to the last one
+        """
+        # Note: same cycle could be reached from any of its uri
+        loop = path_[:-1]
+        start = loop.index(min(loop))
+        loop = tuple(loop[start:] + loop[:start])
+        self.cycles.setdefault(attr_, {}).setdefault(loop, None)
+
+    def tooDeep(self, depth_, uri_=None):
+        """check if object at depth depth_ is too deep to be explored"""
+        if self.depth is not None and depth_ > self.depth:
+            self._save(f"depth {self.depth}", "edge")
+            self._save(f"depth {self.depth}", "object", {uri_})
+            return True
+        return False
+
+    def report(self, explored_=()):
+        """log crawl volume saved by each rule
+
+        :param explored_: uri explored anyway (through another path)
+        """
+        if self.saved:
+            _logger.info("crawl volume saved per rule:")
+        for ruleid, saved in sorted(self.saved.items()):
+            objects = {uri for uri in saved["object"] if uri not in explored_}
+            _logger.info(
+                f"\t{ruleid}: {saved['optional']} OPTIONAL(s) not requested, "
+                f"{saved['edge']} link(s) not followed, "
+                f"{len(objects)} object(s) not explored"
+            )
+
+        if self.cycles:
+            _logger.warning(
+                "cycle(s) found while exploring ICOS CP objects. "
+                "Set attribute's mode to 'uri' or 'ignore' in crawl predicates to avoid them:"
+            )
+        for attr, cycles in sorted(self.cycles.items()):
+            _logger.warning(f"\t{attr}: {len(cycles)} cycle(s)")
+            for loop in list(cycles)[:_cycle_shown]:
+                _logger.warning(f"\t\t{' -> '.join([*loop, loop[0]])}")
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
+
+# See PyCharm help at https://www.jetbrains.com/help/pycharm/
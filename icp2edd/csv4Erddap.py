@@ -4,14 +4,35 @@
 
 # --- import -----------------------------------
 # import from standard lib
+import csv
+import heapq
+import io
+import itertools
+import json
 import logging
+import multiprocessing
+import os
+import re
+import shutil
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # import from other lib
 # > conda forge
+import numpy as np
 import pandas as pd
 from dateutil.parser import parse
 
+try:
+    # optional, see 'arrow' engine
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pacsv
+except ImportError:
+    pa = None
+
 # import from my project
 import icp2edd.util as util
 
@@ -19,6 +40,57 @@ import icp2edd.util as util
 # load logger
 _logger = logging.getLogger(__name__)
 
+# engines used to read, and write csv file (see modify)
+list_engine = ["pandas", "arrow"]
+# time partitions of csv file (see partition), and length of iso 8601 date/time prefix used
+_partitions = {"year": 4, "month": 7, "day": 10}
+list_partition = list(_partitions)
+# name of partition of rows without date/time
+_undated = "undated"
+# suffix of partition file name
+_partition_suffix = r"\.(\d{4}(-\d{2}){0,2}|" + _undated + r")\.csv"
+
+# date/time column name
+_dt_list = ["Date/Time", "TIMESTAMP"]
+# latitude, and longitude column name
+_lat_list = ["Latitude", "latitude", "LATITUDE"]
+_lon_list = ["Longitude", "longitude", "LONGITUDE"]
+# date/time formats tried on a sample, before parsing a whole column at once
+_dt_formats = [
+    "%Y-%m-%dT%H:%M:%S.%fZ",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S",
+]
+# number of values sampled to detect date/time format
+_dt_sample = 100
+# fraction of available memory used to change one chunk of csv file
+_mem_fraction = 0.1
+# memory used by pandas per byte of csv text (rough estimate)
+_mem_factor = 10
+# number of rows changed at once, if available memory is unknown
+_default_chunksize = 100000
+_min_chunksize = 10000
+# sort key of rows without date/time, after any iso 8601 date/time
+_dt_last = "~"
+# date/time already in iso 8601 with 3 decimals
+_dt_conform = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\.\d{3}Z")
+# number of rows sampled at head, middle and tail of csv file, to check conformance
+_probe_rows = 1000
+# size of the tail of csv file sampled, in bytes
+_probe_tail = 1024 * 1024
+# size of block copied at once, in bytes
+_block = 1024 * 1024
+# number of rows of csv stream changed at once (see modifyStream)
+_stream_rows = 10000
+# start method of worker processes (see modifyAll)
+# Note: not 'fork', as download threads could still hold locks, inherited by children
+_mp_method = (
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
 
 # ----------------------------------------------
 def time_format(datetime_, pre_=3):
@@ -62,42 +134,931 @@ def time_format(datetime_, pre_=3):
     )
 
 
-def modify(f):
+def _detect_format(values_):
+    """return format of _dt_formats which parses most values of values_
+
+    None if no format parses at least half of them
+    """
+    best, nbest = None, 0
+    for fmt in _dt_formats:
+        n = pd.to_datetime(values_, format=fmt, errors="coerce").notna().sum()
+        if n > nbest:
+            best, nbest = fmt, n
+    if 2 * nbest < len(values_):
+        return None
+    return best
+
+
+def time_format_column(column_, pre_=3):
+    """
+    change date/time format of every value of column_ from whatever to iso 8601 with only 'pre_' decimal
+
+    date/time format is detected on a sample, then the whole column is parsed, and formatted at once.
+    values which do not match this format are changed one by one (see time_format).
+    missing values are kept.
+
+    :param column_: pandas Series of date and time
+    :param pre_: precision (number of decimal, from 1 to 6)
+
+    :return: pandas Series of date/time (format: iso 8601 with 'pre_' decimal)
+
+    >>> tt = pd.Series(['2019-07-11T10:55:52.123456Z', '2019-07-11T10:55:53Z', '23/12/99'])
+    >>> time_format_column(tt).tolist()
+    ['2019-07-11T10:55:52.123Z', '2019-07-11T10:55:53.000Z', '1999-12-23T00:00:00.000Z']
+    """
+    if not isinstance(pre_, int):
+        raise TypeError(f"Invalid type value, precision {pre_} must be integer.")
+
+    values = column_.dropna()
+    fmt = _detect_format(values.head(_dt_sample)) if pre_ in range(1, 7) else None
+    if fmt is None:
+        # row by row
+        return column_.apply(
+            lambda x: time_format(x, pre_) if isinstance(x, str) else x
+        )
+
+    output = column_.astype(object)
+    parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+    ok = parsed.notna()
+    if ok.any():
+        # round to 'pre_' decimal (half to even, as time_format)
+        rounded = parsed[ok].dt.round(f"{10 ** (6 - pre_)}us")
+        iso = np.datetime_as_string(
+            rounded.values.astype("datetime64[us]"), unit="us"
+        )
+        iso = pd.Series(iso, index=rounded.index).str[: 20 + pre_] + "Z"
+        output[ok.index[ok]] = iso
+    if not ok.all():
+        # values not matching fmt
+        failed = ok.index[~ok]
+        _logger.debug(f"{len(failed)} date/time value(s) do not match {fmt}")
+        output[failed] = values[failed].apply(lambda x: time_format(x, pre_))
+    return output
+
+
+class Stats(object):
+    """statistics of csv columns, updated one chunk of rows at a time
+
+    - number of rows
+    - number of missing values, per column
+    - time, latitude, and longitude min and max
+    """
+
+    def __init__(self):
+        """ """
+        self.rows = 0
+        # {column: number of missing values, ...}
+        self.missing = {}
+        # {'time': [min, max], 'latitude': [min, max], 'longitude': [min, max]}
+        self.bounds = {}
+
+    def addMissing(self, name_, n_):
+        """ """
+        self.missing[name_] = self.missing.get(name_, 0) + int(n_)
+
+    def addBounds(self, key_, min_, max_):
+        """ """
+        if min_ is None or pd.isna(min_):
+            return
+        if key_ not in self.bounds:
+            self.bounds[key_] = [min_, max_]
+        else:
+            _ = self.bounds[key_]
+            _[0] = min(_[0], min_)
+            _[1] = max(_[1], max_)
+
+    def addTime(self, column_):
+        """update time bounds with reformatted Date/Time values (iso 8601 sort as string)"""
+        values = column_.dropna()
+        values = values[values != ""]
+        if len(values):
+            self.addBounds("time", values.min(), values.max())
+
+    def addPosition(self, key_, column_):
+        """update latitude, or longitude, bounds"""
+        values = pd.to_numeric(column_, errors="coerce")
+        self.addBounds(key_, float(values.min()), float(values.max()))
+
+    def update(self, data_):
+        """update statistics with rows of pandas DataFrame data_, once Date/Time reformatted"""
+        self.rows += len(data_)
+        for name in data_.columns:
+            column = data_[name]
+            self.addMissing(name, (column.isna() | (column == "")).sum())
+        for key, names in (("latitude", _lat_list), ("longitude", _lon_list)):
+            for name in names:
+                if name in data_:
+                    self.addPosition(key, data_[name])
+                    break
+        for name in _dt_list:
+            if name in data_:
+                self.addTime(data_[name])
+                break
+
+    def merge(self, other_):
+        """ """
+        self.rows += other_.rows
+        for name, n in other_.missing.items():
+            self.addMissing(name, n)
+        for key, (min_, max_) in other_.bounds.items():
+            self.addBounds(key, min_, max_)
+
+    def attributes(self):
+        """return global attributes {attname: [value], ...}"""
+        att = {}
+        for key, (start, end), bound in (
+            ("time_coverage", ("start", "end"), "time"),
+            ("geospatial_lat", ("min", "max"), "latitude"),
+            ("geospatial_lon", ("min", "max"), "longitude"),
+        ):
+            if bound in self.bounds:
+                att[f"{key}_{start}"] = [self.bounds[bound][0]]
+                att[f"{key}_{end}"] = [self.bounds[bound][1]]
+        return att
+
+    def dump(self, file_):
+        """write statistics in json file"""
+        _ = {"rows": self.rows, "missing": self.missing}
+        _.update({k: {"min": v[0], "max": v[1]} for k, v in self.bounds.items()})
+        file_.write_text(json.dumps(_, indent=2))
+
+    @classmethod
+    def load(cls, file_):
+        """read statistics from json file"""
+        _ = json.loads(file_.read_text())
+        stats = cls()
+        stats.rows = _.pop("rows", 0)
+        stats.missing = _.pop("missing", {})
+        stats.bounds = {k: [v["min"], v["max"]] for k, v in _.items()}
+        return stats
+
+
+def statsFile(f):
+    """return sidecar json file, where statistics of csv file 'f' are written"""
+    return f.parent / (f.stem + ".stats.json")
+
+
+def datasetAttributes(dir_):
+    """return global attributes from statistics of every csv file of dataset directory dir_
+
+    :return: {attname: [value], ...}
+    """
+    stats = Stats()
+    for f in sorted(dir_.glob("*.stats.json")):
+        stats.merge(Stats.load(f))
+    return stats.attributes()
+
+
+def _available_memory():
+    """return available memory in bytes, None if unknown"""
+    try:
+        with open("/proc/meminfo") as fp:
+            for line in fp:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _rowbytes(f_, sample_=1000):
+    """return mean size of rows of csv file f_, in bytes, estimated on the first sample_ rows"""
+    with open(f_, "rb") as fp:
+        lines = list(itertools.islice(fp, sample_ + 1))[1:]
+    return max(1.0, sum(len(x) for x in lines) / max(1, len(lines)))
+
+
+def chunksize(f, sample_=1000):
+    """
+    return number of rows of csv file 'f' to be changed at once, sized from available memory
+
+    :param f: csv file
+    :param sample_: number of rows read to estimate row size
+    """
+    rowbytes = _rowbytes(f, sample_)
+
+    mem = _available_memory()
+    if mem is None:
+        return _default_chunksize
+    return max(_min_chunksize, int(mem * _mem_fraction / (rowbytes * _mem_factor)))
+
+
+def _sample(f_, n_=_probe_rows):
+    """return header, and rows sampled at head, middle and tail of csv file f_"""
+    with open(f_, "rb") as fp:
+        header = fp.readline()
+        start = fp.tell()
+        size = os.fstat(fp.fileno()).st_size
+        lines = []
+        positions = (start, max(start, size // 2), max(start, size - _probe_tail))
+        for pos in dict.fromkeys(positions):
+            fp.seek(pos)
+            if pos != start:
+                # skip partial line
+                fp.readline()
+            lines.extend(itertools.islice(fp, n_))
+    header = next(csv.reader([header.decode("utf-8")]), [])
+    rows = list(csv.reader(x.decode("utf-8") for x in lines))
+    return header, rows
+
+
+def conform(f, order_=None):
+    """
+    check Date/Time columns of csv file 'f' are already in iso 8601 with 3 decimals
+
+    rows at head, middle and tail of the file are checked first, then every other row,
+    reading Date/Time column(s) only, check stops on first value to be changed.
+
+    :param f: csv file
+    :param order_: Order, if any, updated with first Date/Time column of every row checked
+    :return: True if no Date/Time value needs to be changed
+    """
+    try:
+        header, rows = _sample(f)
+    except (UnicodeDecodeError, csv.Error):
+        return False
+
+    idx = [i for i, x in enumerate(header) if util.filterBracket(x) in _dt_list]
+    if not idx or not rows:
+        return False
+    for row in rows:
+        if len(row) != len(header):
+            # ex: quoted new line in sampled rows
+            return False
+        for i in idx:
+            if row[i] and not _dt_conform.fullmatch(row[i]):
+                return False
+
+    names = [header[i] for i in idx]
+    try:
+        reader = pd.read_csv(
+            f, usecols=names, chunksize=chunksize(f), dtype=str, keep_default_na=False
+        )
+        for data in reader:
+            for name in names:
+                column = data[name]
+                ok = column.eq("") | column.str.fullmatch(_dt_conform.pattern)
+                if not ok.all():
+                    return False
+            if order_ is not None:
+                order_.update(data[names[0]])
+    except (UnicodeDecodeError, ValueError, pd.errors.ParserError):
+        return False
+    return True
+
+
+def _modifyHeader(f):
+    """
+    overwrite csv file 'f', removing units from variable name
+
+    only the header line is changed, the rest of the file is copied block by block.
+    """
+    with open(f, "rb") as src:
+        line = src.readline()
+        eol = b"\r\n" if line.endswith(b"\r\n") else b"\n"
+        names = next(csv.reader([line.decode("utf-8")]))
+        header = [util.filterBracket(x) for x in names]
+        if header == names:
+            _logger.debug(f"nothing to change in {f}")
+            return
+
+        # Warning : overwrite file
+        # Note: write a new file, then rename it, as 'f' could be hard-linked to the data store
+        tmp = f.parent / (f.name + ".tmp")
+        try:
+            with open(tmp, "wb") as out:
+                buf = io.StringIO()
+                csv.writer(buf, lineterminator="").writerow(header)
+                out.write(buf.getvalue().encode("utf-8") + eol)
+                shutil.copyfileobj(src, out, _block)
+        except Exception:
+            if tmp.exists():
+                tmp.unlink()
+            raise
+    os.replace(tmp, f)
+
+
+def _modifyPandas(f_, out_, chunksize_, passthrough_=True, stats_=None, order_=None):
+    """write csv file f_ changed into out_, with pandas, one chunk of rows at a time
+
+    stats_ (see Stats), and order_ (see Order), if any, are updated with each chunk of rows changed.
+    """
+    with open(out_, "w", newline="") as out:
+        # Read data from file 'filename.csv'
+        if passthrough_:
+            # Note: keep empty, or 'NaN', values as written
+            kwargs = dict(dtype=str, keep_default_na=False)
+        else:
+            kwargs = {}
+        reader = pd.read_csv(f_, chunksize=chunksize_, **kwargs)
+        for i, data in enumerate(reader):
+            # remove units from variable name
+            # WARNING: report change on header on superObj.DatasetVariable keys
+            # TODO see how ERDDAP handle second line with unit, and unit between parentheses ?
+            # data.rename(columns=lambda x: re.sub(r'(.*)(\[.*\])(.*)', r'\1'r'\3', x), inplace=True)
+            data.rename(columns=lambda x: util.filterBracket(x), inplace=True)
+
+            # reformat Date & Time with 3 decimals only
+            dt_list = _dt_list  # column name
+            if any(dt in data for dt in dt_list):
+                for dt in dt_list:
+                    if dt in data:
+                        # Note: empty value is missing value
+                        column = data[dt].mask(data[dt] == "")
+                        data[dt] = time_format_column(column, 3)
+                if order_ is not None:
+                    order_.update(data[next(dt for dt in data if dt in dt_list)])
+            elif i == 0:
+                _logger.warning(f"Can not find 'Date/Time' column in csv file -{f_}-")
+
+            if stats_ is not None:
+                stats_.update(data)
+
+            data.to_csv(
+                out,
+                header=(i == 0),
+                date_format="%Y-%m-%dT%H:%M:%S.%fZ",
+                index=False,
+            )
+
+
+def _modifyArrow(f_, out_, chunksize_, passthrough_=True, stats_=None, order_=None):
+    """write csv file f_ changed into out_, with Arrow, one block of rows at a time
+
+    input file is memory-mapped, and parsed by Arrow multi-threaded reader.
+    Date/Time are reformatted as with pandas engine (see time_format_column).
+    stats_ (see Stats), and order_ (see Order), if any, are updated with each block of rows changed,
+    only Date/Time, latitude, and longitude columns are converted to pandas.
+    """
+    if pa is None:
+        raise ImportError(
+            "engine 'arrow' needs pyarrow, install it or use engine 'pandas'"
+        )
+
+    with open(f_, newline="", encoding="utf-8") as fp:
+        names = next(csv.reader(fp), [])
+    # remove units from variable name
+    # WARNING: report change on header on superObj.DatasetVariable keys
+    header = [util.filterBracket(x) for x in names]
+    dts = [n for n, h in zip(names, header) if h in _dt_list]
+    positions = {}
+    for key, names_ in (("latitude", _lat_list), ("longitude", _lon_list)):
+        _ = [n for n, h in zip(names, header) if h in names_]
+        if _:
+            positions[_[0]] = key
+    if not dts:
+        _logger.warning(f"Can not find 'Date/Time' column in csv file -{f_}-")
+
+    # Note: keep empty values as written
+    types = {n: pa.string() for n in (names if passthrough_ else dts)}
+    read_options = pacsv.ReadOptions(
+        use_threads=True,
+        block_size=int(min(max(chunksize_ * _rowbytes(f_), _block), 2 ** 30)),
+    )
+    convert_options = pacsv.ConvertOptions(
+        column_types=types, strings_can_be_null=False
+    )
+
+    with pa.memory_map(str(f_)) as source, open(out_, "wb") as out:
+        reader = pacsv.open_csv(
+            source, read_options=read_options, convert_options=convert_options
+        )
+        # Note: Arrow always quotes header
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerow(header)
+        out.write(buf.getvalue().encode("utf-8"))
+
+        for batch in reader:
+            if stats_ is not None:
+                stats_.rows += batch.num_rows
+            columns = []
+            for name, head, column in zip(names, header, batch.columns):
+                if name in dts:
+                    # reformat Date & Time with 3 decimals only
+                    # Note: empty value is missing value
+                    _ = column.to_pandas()
+                    _ = time_format_column(_.mask(_ == ""), 3)
+                    if stats_ is not None and name == dts[0]:
+                        stats_.addTime(_)
+                    if order_ is not None and name == dts[0]:
+                        order_.update(_)
+                    column = pa.array(_, type=pa.string(), from_pandas=True)
+                if stats_ is not None:
+                    missing = column.null_count
+                    if pa.types.is_string(column.type):
+                        missing += pc.sum(pc.equal(column, "")).as_py() or 0
+                    stats_.addMissing(head, missing)
+                    if name in positions:
+                        stats_.addPosition(positions[name], column.to_pandas())
+                columns.append(column)
+            out.write(_arrowCsv(pa.RecordBatch.from_arrays(columns, names=header)))
+
+
+def _arrowCsv(batch_):
+    """return Arrow record batch as csv bytes, without header
+
+    batches where some values need to be quoted are written by pandas,
+    so that only those values are quoted, as with pandas engine.
+    """
+    buf = pa.BufferOutputStream()
+    options = pacsv.WriteOptions(include_header=False, quoting_style="none")
+    try:
+        pacsv.write_csv(batch_, buf, options)
+    except pa.ArrowInvalid:
+        # some values contain delimiter, quote, or new line
+        # Note: Arrow 'needed' quoting style quotes every string value
+        text = batch_.to_pandas().to_csv(header=False, index=False)
+        return text.encode("utf-8")
+    return buf.getvalue().to_pybytes()
+
+
+# function used by each engine
+_engines = {"pandas": _modifyPandas, "arrow": _modifyArrow}
+
+
+def modify(f, chunksize_=None, passthrough_=True, engine_="pandas", stats_=False):
     """
     overwrite csv file 'f' after few change:
     - remove units from variable name
     - reformat Date/Time with 3 decimals
 
+    file is changed one chunk of rows at a time, so memory used is bounded whatever the file size.
+    if Date/Time are already reformatted (see conform), only the header line is changed,
+    unless statistics of columns (see Stats) are asked: they are computed while rows are
+    rewritten, and written in sidecar json file (see statsFile).
+
     :param f: csv file to be changed
+    :param chunksize_: number of rows changed at once [default: sized from available memory]
+    :param passthrough_: read values as raw strings, so that only Date/Time values are changed,
+        others are written as read (no type inference, no float reformatting)
+    :param engine_: engine used to read, and write csv file, in list_engine
+        'pandas': pandas reader and writer
+        'arrow': Arrow multi-threaded reader and writer, on memory-mapped file (needs pyarrow)
+    :param stats_: compute statistics of columns, and write them in sidecar json file
 
+    :return: True if rows are sorted by Date/Time (see sort), False otherwise
     TODO check output file, see unittest and mock file
     """
     if not isinstance(f, Path):
         raise TypeError(f"Invalid type value, f -{f}- must be Path object")
 
-    # Read data from file 'filename.csv'
-    data = pd.read_csv(f)
+    if engine_ not in _engines:
+        raise ValueError(f"Invalid value, engine -{engine_}- must be in {list_engine}")
+
+    # Note: statistics of previous content are outdated
+    sidecar = statsFile(f)
+    if sidecar.exists():
+        sidecar.unlink()
+
+    # Note: rows order is checked while rows are read, so that sort reads only unsorted file
+    order = Order()
+    if not stats_ and conform(f, order):
+        # Date/Time already reformatted, only header needs to be changed
+        _logger.debug(f"Date/Time already conform in {f}, change header only")
+        _modifyHeader(f)
+        return order.sorted
+
+    if chunksize_ is None:
+        chunksize_ = chunksize(f)
+    _logger.debug(f"change {f} with {engine_} by chunk of {chunksize_} rows")
+
+    stats = Stats() if stats_ else None
+    order = Order()
+
+    # Warning : overwrite file
+    # Note: write a new file, then rename it, as 'f' could be hard-linked to the data store
+    tmp = f.parent / (f.name + ".tmp")
+    try:
+        _engines[engine_](f, tmp, chunksize_, passthrough_, stats, order)
+    except Exception:
+        if tmp.exists():
+            tmp.unlink()
+        raise
+    os.replace(tmp, f)
+    if stats is not None:
+        stats.dump(sidecar)
+    return order.sorted
+
+
+def timeColumn(f):
+    """return name of Date/Time column of csv file 'f', None if not found"""
+    with open(f, newline="", encoding="utf-8") as fp:
+        header = next(csv.reader(fp), [])
+    for x in header:
+        if x in _dt_list:
+            return x
+    return None
+
+
+def _sortKey(column_):
+    """return sort key of Date/Time column, already in iso 8601 (see conform)
+
+    Note: iso 8601 date/time sort as string, rows without Date/Time sorted last
+    """
+    return column_.where(column_ != "", _dt_last)
+
+
+class Order(object):
+    """check rows are sorted by Date/Time (see sort), given a chunk of rows at a time
+
+    >>> order = Order()
+    >>> order.update(pd.Series(["2019-07-11T10:55:52.000Z", None]))
+    >>> order.sorted
+    True
+    >>> order.update(pd.Series(["2019-07-11T10:55:51.000Z"]))
+    >>> order.sorted
+    False
+    """
+
+    def __init__(self):
+        """ """
+        self.sorted = True
+        self._last = None
+
+    def update(self, column_):
+        """update with Date/Time column of next chunk of rows, missing values are sorted last"""
+        if not self.sorted or len(column_) == 0:
+            return
+        key = _sortKey(column_.fillna(""))
+        if not key.is_monotonic_increasing or (
+            self._last is not None and key.iloc[0] < self._last
+        ):
+            self.sorted = False
+            return
+        self._last = key.iloc[-1]
+
+
+def isSorted(f, chunksize_=None):
+    """return True if rows of csv file 'f', already modified, are sorted by Date/Time
+
+    only Date/Time column is read, and check stops on first row out of order.
+    """
+    name = timeColumn(f)
+    if name is None:
+        return True
+    if chunksize_ is None:
+        chunksize_ = chunksize(f)
+
+    order = Order()
+    reader = pd.read_csv(
+        f, usecols=[name], chunksize=chunksize_, dtype=str, keep_default_na=False
+    )
+    for data in reader:
+        order.update(data[name])
+        if not order.sorted:
+            return False
+    return True
+
+
+def _mergeRuns(runs_, out_, index_):
+    """merge csv files runs_, each sorted by column index_, into out_"""
+    files = [open(r, newline="", encoding="utf-8") for r in runs_]
+    try:
+        readers = [csv.reader(fp) for fp in files]
+        header = [next(r) for r in readers][0]
+        with open(out_, "w", newline="", encoding="utf-8") as out:
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerow(header)
+            # Note: merge is stable, rows with same Date/Time keep their order
+            writer.writerows(
+                heapq.merge(*readers, key=lambda row: row[index_] or _dt_last)
+            )
+    finally:
+        for fp in files:
+            fp.close()
+
+
+def sort(f, chunksize_=None, sorted_=None):
+    """
+    overwrite csv file 'f', already modified, with its rows sorted by Date/Time
+
+    nothing is written if rows are already sorted (see isSorted), or known to be (see modify).
+    file is sorted one chunk of rows at a time, then sorted chunks are merged,
+    so memory used is bounded whatever the file size.
+    rows with same Date/Time keep their order, rows without Date/Time are written last.
+
+    :param f: csv file to be sorted
+    :param chunksize_: number of rows sorted at once [default: sized from available memory]
+    :param sorted_: rows are sorted or not, as returned by modify [default: read to be checked]
+
+    :return: True if file was sorted, False otherwise
+    """
+    name = timeColumn(f)
+    if name is None:
+        _logger.warning(f"Can not find 'Date/Time' column in csv file -{f}-")
+        return False
+    if chunksize_ is None:
+        chunksize_ = chunksize(f)
+
+    if sorted_ is None:
+        sorted_ = isSorted(f, chunksize_)
+    if sorted_:
+        _logger.debug(f"{f} already sorted by {name}")
+        return False
+
+    _logger.debug(f"sort {f} by {name}, by chunk of {chunksize_} rows")
+    # Warning : overwrite file
+    # Note: write a new file, then rename it, as 'f' could be hard-linked to the data store
+    tmp = f.parent / (f.name + ".tmp")
+    runs = []
+    try:
+        reader = pd.read_csv(f, chunksize=chunksize_, dtype=str, keep_default_na=False)
+        for i, data in enumerate(reader):
+            order = np.argsort(_sortKey(data[name]).to_numpy(), kind="stable")
+            runs.append(f.parent / f"{f.name}.{i}.run")
+            data.iloc[order].to_csv(runs[-1], index=False)
+        if len(runs) == 1:
+            os.replace(runs.pop(), tmp)
+        else:
+            _mergeRuns(runs, tmp, list(data.columns).index(name))
+        os.replace(tmp, f)
+    finally:
+        for r in runs + [tmp]:
+            if r.exists():
+                r.unlink()
+    return True
+
+
+def fileRegex(partition_=None):
+    """return regex of csv file names of dataset, as given to ERDDAP
+
+    >>> fileRegex()
+    '.*\\\\.csv'
+    >>> fileRegex('month')
+    '.*\\\\.(\\\\d{4}(-\\\\d{2}){0,2}|undated)\\\\.csv'
+    """
+    if partition_ is None:
+        return r".*\.csv"
+    return r".*" + _partition_suffix
+
+
+def partitionFile(f, key_):
+    """return csv file of partition key_ of csv file 'f' ('2019', '2019-07', 'undated', ...)"""
+    return f.parent / f"{f.stem}.{key_}{f.suffix}"
+
+
+def removePartitions(f):
+    """remove every partition of csv file 'f', written by a previous run"""
+    regex = re.compile(re.escape(f.stem) + _partition_suffix)
+    for p in f.parent.glob(f"{f.stem}.*{f.suffix}"):
+        if regex.fullmatch(p.name):
+            p.unlink()
+
+
+def setAside(f):
+    """rename csv file 'f', which can not be changed, so that it is no more part of its dataset
+
+    file is renamed '<name>.failed' (see fileRegex), its partitions, and statistics, are removed.
+
+    :return: file renamed, None if 'f' does not exist any more
+    """
+    removePartitions(f)
+    sidecar = statsFile(f)
+    if sidecar.exists():
+        sidecar.unlink()
+    if not f.exists():
+        return None
+    aside = f.parent / (f.name + ".failed")
+    os.replace(f, aside)
+    _logger.warning(f"set aside csv file {f} as {aside.name}")
+    return aside
+
+
+def partition(f, partition_="month", chunksize_=None):
+    """
+    split csv file 'f', already modified, in time-partitioned files, then remove it
+
+    partitions are written next to 'f' (see partitionFile), one per year, month, or day,
+    so that ERDDAP could skip files outside the time range requested.
+    rows keep their order, rows without Date/Time are written in partition 'undated'.
+
+    :param f: csv file to be split
+    :param partition_: time partition, in list_partition
+    :param chunksize_: number of rows read at once [default: sized from available memory]
+
+    :return: list of partitions written
+    """
+    if partition_ not in _partitions:
+        raise ValueError(
+            f"Invalid value, partition -{partition_}- must be in {list_partition}"
+        )
+
+    removePartitions(f)
+    if chunksize_ is None:
+        chunksize_ = chunksize(f)
+
+    with open(f, newline="", encoding="utf-8") as fp:
+        header = next(csv.reader(fp), [])
+    dts = [x for x in header if x in _dt_list]
+    if not dts:
+        _logger.warning(f"Can not find 'Date/Time' column in csv file -{f}-")
+
+    written = {}
+    reader = pd.read_csv(f, chunksize=chunksize_, dtype=str, keep_default_na=False)
+    for data in reader:
+        if dts:
+            # Note: Date/Time already in iso 8601, see conform
+            keys = data[dts[0]].str[: _partitions[partition_]]
+            keys = keys.where(data[dts[0]] != "", _undated)
+        else:
+            keys = pd.Series(_undated, index=data.index)
+        for key, rows in data.groupby(keys, sort=False):
+            out = partitionFile(f, key)
+            with open(out, "a", newline="", encoding="utf-8") as fp:
+                rows.to_csv(fp, header=out not in written, index=False)
+            written[out] = None
+
+    f.unlink()
+    _logger.debug(f"{f} split in {len(written)} {partition_} partition(s)")
+    return list(written)
+
+
+class _ListHandler(logging.Handler):
+    """keep log records emitted in worker process, to be emitted again by main process"""
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        # Note: make record picklable
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        self.records.append(record)
+
+
+_handler = None
+
+
+def _initWorker(level_):
+    """replace log handlers of worker process by a list handler"""
+    global _handler
+
+    _handler = _ListHandler()
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(_handler)
+    root.setLevel(level_)
+
+
+def _modifyWorker(f_, kwargs_):
+    """modify csv file in worker process
+
+    :return: log records emitted, rows sorted or not (see modify), and error (traceback as string) if any
+    """
+    _handler.records = []
+    sorted_, error = None, None
+    try:
+        sorted_ = modify(f_, **kwargs_)
+    except Exception:
+        error = traceback.format_exc()
+    return _handler.records, sorted_, error
+
+
+def _modifyOne(f_, kwargs_):
+    """modify csv file in main process
+
+    :return: no log record, rows sorted or not (see modify), and error (traceback as string) if any
+    """
+    try:
+        sorted_ = modify(f_, **kwargs_)
+    except Exception:
+        return [], None, traceback.format_exc()
+    return [], sorted_, None
+
+
+def modifyAll(files_, workers_=1, **kwargs):
+    """
+    modify every csv file of files_ (see modify), in a pool of workers_ processes
+
+    files are submitted as soon as files_ yield them, and results are yielded in the same order,
+    log records of each file are emitted by main process, in the same order too.
+    A file which can not be modified does not stop the others.
+
+    :param files_: iterable of csv files
+    :param workers_: number of processes used
+    :param kwargs: keywords arguments of modify (chunksize_, passthrough_, engine_, stats_)
+
+    :return: generator of (file, sorted, error), sorted as returned by modify (None on error),
+        error is None if file was modified, the traceback as string otherwise
+    """
+    if workers_ <= 1:
+        for f in files_:
+            _, sorted_, error = _modifyOne(f, kwargs)
+            yield f, sorted_, error
+        return
+
+    def _result(f_, future_):
+        records, sorted_, error = future_.result()
+        for record in records:
+            logging.getLogger(record.name).handle(record)
+        return f_, sorted_, error
+
+    queue = deque()
+    with ProcessPoolExecutor(
+        max_workers=workers_,
+        mp_context=multiprocessing.get_context(_mp_method),
+        initializer=_initWorker,
+        initargs=(logging.getLogger().getEffectiveLevel(),),
+    ) as pool:
+        for f in files_:
+            queue.append((f, pool.submit(_modifyWorker, f, kwargs)))
+            # yield files already modified, in submission order
+            while queue and queue[0][1].done():
+                yield _result(*queue.popleft())
+        while queue:
+            yield _result(*queue.popleft())
+
+
+def modifyStream(in_, out_, name_=None, stats_=False):
+    """
+    write csv stream 'in_' into 'out_', with the same change as modify, one batch of rows at a time:
+    - remove units from variable name
+    - reformat Date/Time with 3 decimals (see time_format_column)
+
+    Note: only _stream_rows rows are held in memory, other columns are written as read.
+    statistics of columns (see Stats) are updated every batch of rows, and written in sidecar
+    json file of name_ (see statsFile), next to 'out_' file.
+
+    :param in_: input text stream
+    :param out_: output text stream
+    :param name_: name of the csv file, used in log message
+    :param stats_: compute statistics of columns, when 'out_' is a file
+
+    >>> import io
+    >>> out = io.StringIO()
+    >>> modifyStream(io.StringIO('Date/Time,fCO2 [uatm]\\n2019-07-11T10:55:52.000000Z,1.50\\n'), out)
+    >>> print(out.getvalue(), end="")
+    Date/Time,fCO2
+    2019-07-11T10:55:52.000Z,1.50
+    """
+    reader = csv.reader(in_)
+    writer = csv.writer(out_, lineterminator="\n")
+
+    try:
+        header = next(reader)
+    except StopIteration:
+        return
 
     # remove units from variable name
     # WARNING: report change on header on superObj.DatasetVariable keys
-    # TODO see how ERDDAP handle second line with unit, and unit between parentheses ?
-    # data.rename(columns=lambda x: re.sub(r'(.*)(\[.*\])(.*)', r'\1'r'\3', x), inplace=True)
-    data.rename(columns=lambda x: util.filterBracket(x), inplace=True)
+    header = [util.filterBracket(x) for x in header]
+    writer.writerow(header)
 
     # reformat Date & Time with 3 decimals only
-    dt_list = ["Date/Time", "TIMESTAMP"]  # column name
-    if any(dt in data for dt in dt_list):
-        for dt in dt_list:
-            if dt in data:
-                data[dt] = data[dt].apply(lambda x: time_format(x, 3))
-    else:
-        _logger.warning(f"Can not find 'Date/Time' column in csv file -{f}-")
+    idx = [i for i, x in enumerate(header) if x in _dt_list]
+    if not idx:
+        _logger.warning(f"Can not find 'Date/Time' column in csv file -{name_}-")
 
-    # Preview the first 5 lines of the loaded data
-    # print(data.head())
+    stats = None
+    if stats_ and name_ is not None and isinstance(getattr(out_, "name", None), str):
+        stats = Stats()
 
-    # Warning : overwrite file
-    data.to_csv(f, date_format="%Y-%m-%dT%H:%M:%S.%fZ", index=False)
+    def _write(rows_):
+        """reformat Date/Time of every row of rows_ at once, then write them"""
+        for i in idx:
+            # Note: empty value is missing value
+            column = pd.Series(
+                [r[i] if i < len(r) and r[i] else None for r in rows_], dtype=object
+            )
+            for r, value in zip(rows_, time_format_column(column, 3)):
+                if isinstance(value, str):
+                    r[i] = value
+        writer.writerows(rows_)
+        if stats is not None:
+            stats.update(_frame(rows_, header))
+
+    rows = []
+    for row in reader:
+        rows.append(row)
+        if len(rows) >= _stream_rows:
+            _write(rows)
+            rows = []
+    if rows:
+        _write(rows)
+
+    if stats is not None:
+        stats.dump(statsFile(Path(out_.name).parent / Path(name_).name))
+
+
+def modifyStreamStats(in_, out_, name_=None):
+    """write csv stream 'in_' into 'out_', as modifyStream, computing statistics of columns"""
+    modifyStream(in_, out_, name_, stats_=True)
+
+
+def _frame(rows_, header_):
+    """return rows_ as pandas DataFrame of strings, with header_ as columns"""
+    n = len(header_)
+    return pd.DataFrame(
+        [(r + [""] * (n - len(r)))[:n] for r in rows_], columns=header_, dtype=str
+    )
 
 
 # Press the green button in the gutter to run the script.
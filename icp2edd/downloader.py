@@ -0,0 +1,685 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# downloader.py
+
+"""
+    This module set up a concurrent download engine of ICOS CP data files.
+
+    Files are downloaded by a bounded pool of threads, on one shared pooled HTTP session.
+    Data are written in a '.part' file, next to a journal '.part.json' recording the expected size.
+    An interrupted download is resumed (HTTP Range request) during the next run, if the server supports it.
+    The final file only appears, by atomic rename, once download is complete.
+    Data are read in a reused buffer, and sha256 is computed while writing, so checking
+    the file against cpmeta:hasSha256sum does not read it again.
+    A job can carry a transform (ex: csv4Erddap.modifyStream), then the body is decoded,
+    and transformed row by row while downloading: only the transformed file is written.
+    Before downloading, free disk space is checked, and files are ordered newest, and smallest first,
+    so that each file can be processed as soon as it is downloaded, while others keep downloading.
+    Note: datasets.xml is still published once, after every file is processed (see __main__.py).
+    Files are kept in a content-addressed store, keyed by their sha256 (cpmeta:hasSha256sum),
+    and hard-linked into dataset directories: a file already in store is never downloaded again.
+
+    Example usage:
+
+    from downloader import Downloader
+
+    jobs = [Job(uri, filename, dirout, size, sha256), ...]
+    dl = Downloader(workers, store, buffer) # initialise download engine
+    output = dl.run(jobs)           # download every file, return {filename: dirout}
+    for filename, dirout in dl.iterRun(jobs):   # yield each file, as soon as downloaded
+        ...
+"""
+
+# --- import -----------------------------------
+# import from standard lib
+import datetime as dt
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+# import from other lib
+import requests
+from dateutil.parser import parse
+from requests.adapters import HTTPAdapter
+from requests.exceptions import HTTPError
+
+# import from my project
+import icp2edd.session as session
+
+# --- module's variable ------------------------
+# load logger
+_logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+
+
+# ----------------------------------------------
+def _hashFile(file_, hash_=None, buffer_=_MB):
+    """update hash_ with file content, read in buffer of buffer_ bytes
+
+    :return: hash object
+    """
+    if hash_ is None:
+        hash_ = hashlib.sha256()
+    buf = memoryview(bytearray(buffer_))
+    with open(file_, "rb", buffering=0) as f:
+        for n in iter(lambda: f.readinto(buf), 0):
+            hash_.update(buf[:n])
+    return hash_
+
+
+def _sha256(file_, buffer_=_MB):
+    """return sha256 (hexadecimal) of file content"""
+    return _hashFile(file_, buffer_=buffer_).hexdigest()
+
+
+def _link(src_, dst_, replace_=True):
+    """atomically replace dst_ by a hard link to src_ (copy if hard link is not possible)
+
+    :param replace_: replace dst_ if it exists, raise FileExistsError otherwise
+    """
+    # Note: unique temporary name, as several jobs could link the same file at the same time
+    tmp = dst_.parent / f"{dst_.name}.{uuid.uuid4().hex}.link"
+    try:
+        os.link(src_, tmp)
+    except OSError:
+        # ex: store and dataset directories on different file systems
+        shutil.copy2(src_, tmp)
+    try:
+        if replace_:
+            os.replace(tmp, dst_)
+        else:
+            os.link(tmp, dst_)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+def _rangeStart(response_):
+    """return first byte of partial content response, from its Content-Range header
+
+    >>> r = requests.Response()
+    >>> r.headers["Content-Range"] = "bytes 100-199/200"
+    >>> _rangeStart(r)
+    100
+    >>> del r.headers["Content-Range"]
+    >>> _rangeStart(r) is None
+    True
+    """
+    # ex: 'bytes 100-199/200'
+    unit, _, value = response_.headers.get("Content-Range", "").partition(" ")
+    try:
+        return int(value.split("-")[0]) if unit == "bytes" else None
+    except ValueError:
+        return None
+
+
+def _timestamp(date_):
+    """return POSIX timestamp of date, None if not available"""
+    if date_ is None:
+        return None
+    try:
+        _ = parse(date_)
+    except (ValueError, OverflowError):
+        _logger.warning(f"can not parse date -{date_}-")
+        return None
+    if _.tzinfo is None:
+        _ = _.replace(tzinfo=dt.timezone.utc)
+    return _.timestamp()
+
+
+def schedule(jobs_):
+    """return jobs_ ordered newest first, then smallest first
+
+    jobs without submitted date, or size, come last.
+    """
+
+    def key(job_):
+        ts = _timestamp(job_.submitted)
+        return (
+            ts is None,
+            -ts if ts is not None else 0,
+            job_.size is None,
+            job_.size if job_.size is not None else 0,
+        )
+
+    return sorted(jobs_, key=key)
+
+
+class _HashReader(io.RawIOBase):
+    """raw stream, which update hash with every byte read"""
+
+    def __init__(self, raw_, hash_=None):
+        """
+        :param raw_: raw stream (ex: response.raw)
+        :param hash_: hash object [default: no hash]
+        """
+        self._raw = raw_
+        self._hash = hash_
+        # bytes read
+        self.nbytes = 0
+
+    def readable(self):
+        """ """
+        return True
+
+    def readinto(self, b_):
+        """ """
+        n = self._raw.readinto(b_)
+        if n:
+            if self._hash is not None:
+                self._hash.update(memoryview(b_)[:n])
+            self.nbytes += n
+        return n
+
+
+# ----------------------------------------------
+class Job(object):
+    """file to be downloaded"""
+
+    def __init__(
+        self,
+        uri_,
+        filename_,
+        dirout_,
+        size_=None,
+        sha256_=None,
+        transform_=None,
+        submitted_=None,
+    ):
+        """
+        :param uri_: ICOS CP uri of the DataObject
+        :param filename_: output filename
+        :param dirout_: output directory
+        :param size_: expected size in bytes (cpmeta:hasSizeInBytes)
+        :param sha256_: expected sha256 in hexadecimal (cpmeta:hasSha256sum)
+        :param transform_: function(in_, out_, name_) applied to text stream while downloading
+        :param submitted_: submission date ( '2020-01-01T00:00:00.000Z' ), used to schedule download
+        """
+        self.uri = uri_
+        self.filename = filename_
+        self.dirout = dirout_
+        self.size = int(size_) if size_ is not None else None
+        self.sha256 = sha256_.lower() if sha256_ is not None else None
+        self.transform = transform_
+        self.submitted = submitted_
+
+    @property
+    def pid(self):
+        """ """
+        return self.uri.split("/")[-1]
+
+    @property
+    def url(self):
+        """ """
+        return str(self.uri).replace("meta", "data")
+
+    @property
+    def fileout(self):
+        """ """
+        return self.dirout / self.filename
+
+    @property
+    def part(self):
+        """partial file, where data are written while downloading"""
+        return self.dirout / (str(self.filename) + ".part")
+
+    @property
+    def journal(self):
+        """journal of partial file"""
+        return self.dirout / (str(self.filename) + ".part.json")
+
+    @property
+    def key(self):
+        """key of file in content-addressed store, None if sha256 unknown
+
+        transformed file is stored apart from original one
+        """
+        if self.sha256 is None:
+            return None
+        if self.transform is None:
+            return self.sha256
+        return f"{self.sha256}.{self.transform.__name__}"
+
+    def _record(self):
+        """ """
+        return {"uri": self.uri, "size": self.size}
+
+    def resumeFrom(self):
+        """return number of bytes already downloaded in partial file, by previous run
+
+        partial file is only reused if its journal records the same object, and size.
+        Note: transformed file is never resumed, as its size differs from the original one
+        """
+        if self.transform is not None:
+            return 0
+        if not self.part.is_file() or not self.journal.is_file():
+            return 0
+        try:
+            record = json.loads(self.journal.read_text())
+        except ValueError:
+            return 0
+        if record != self._record():
+            _logger.info(f"journal of {self.part} differs, download again")
+            return 0
+        offset = self.part.stat().st_size
+        if self.size is not None and offset > self.size:
+            return 0
+        return offset
+
+    def writeJournal(self):
+        """ """
+        self.journal.write_text(json.dumps(self._record()))
+
+
+class DataStore(object):
+    """content-addressed store of data files, keyed by sha256 (see Job.key)
+
+    each file linked from the store into a dataset directory is referenced by a file
+    '<filename>.store' next to it, holding its key. Files of the store are kept as long as
+    they are referenced, even once the dataset file is changed (see csv4Erddap).
+    """
+
+    def __init__(self, path_):
+        """
+        :param path_: store directory
+        """
+        self._path = Path(path_)
+
+    def path(self, sha256_):
+        """return path of file with content sha256_ in store"""
+        return self._path / sha256_[:2] / sha256_
+
+    def has(self, sha256_):
+        """ """
+        return self.path(sha256_).is_file()
+
+    @staticmethod
+    def reference(fileout_):
+        """return file referencing the key of fileout_ in store"""
+        return fileout_.parent / (fileout_.name + ".store")
+
+    def linkTo(self, sha256_, fileout_):
+        """hard link file with content sha256_ as fileout_, if not already, and reference it"""
+        src = self.path(sha256_)
+        if not (fileout_.is_file() and os.path.samefile(src, fileout_)):
+            _link(src, fileout_)
+        self.reference(fileout_).write_text(sha256_)
+
+    def ingest(self, fileout_, sha256_):
+        """add fileout_ (with content sha256_) into store, if not already"""
+        dst = self.path(sha256_)
+        if not dst.is_file():
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                _link(fileout_, dst, replace_=False)
+            except FileExistsError:
+                # Note: same content added by another job meanwhile
+                pass
+        self.linkTo(sha256_, fileout_)
+
+    def device(self):
+        """return file system (st_dev) of store, and a path on it"""
+        path = self._path
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        return path.stat().st_dev, path
+
+    def evict(self, root_):
+        """remove files of store no longer referenced from any dataset directory under root_
+
+        ex: dataset directory of a previous version retired (see supersession.py),
+        or dataset file downloaded again with another content
+
+        :param root_: directory of dataset directories (see setupcfg.datasetCsvPath)
+        :return: number of bytes freed
+        """
+        keys = set()
+        for ref in Path(root_).glob("**/*.store"):
+            if ref.is_file():
+                keys.add(ref.read_text().strip())
+
+        nfiles, nbytes = 0, 0
+        if not self._path.is_dir():
+            return nbytes
+        for f in self._path.glob("*/*"):
+            if f.name in keys or not f.is_file() or f.name.endswith(".link"):
+                continue
+            nbytes += f.stat().st_size
+            nfiles += 1
+            f.unlink()
+        _logger.info(
+            f"{nfiles} unreferenced file(s) evicted from store {self._path}: "
+            f"{nbytes / _MB:.1f} MB freed"
+        )
+        return nbytes
+
+
+class Downloader(object):
+    """ """
+
+    def __init__(self, workers_=1, store_=None, buffer_=_MB):
+        """initialise download engine
+
+        :param workers_: number of files downloaded at the same time
+        :param store_: content-addressed store directory [default: no store]
+        :param buffer_: size (in bytes) of buffer used to read, hash and write data files
+        """
+        self._workers = max(1, int(workers_))
+        self._store = DataStore(store_) if store_ is not None else None
+        self._buffer = max(1, int(buffer_))
+        # bytes downloaded during last run
+        self.nbytes = 0
+
+    def _fetch(self, http_, job_):
+        """download one file, resume partial download of previous run if any
+
+        :return: number of bytes downloaded
+        """
+        cookies = dict(CpLicenseAcceptedFor=job_.pid)
+
+        if self._reuse(job_):
+            return 0
+
+        offset = job_.resumeFrom()
+        if job_.size is not None and offset == job_.size:
+            _logger.info(f"file {job_.uri} already downloaded in {job_.part}")
+            self._accept(job_)
+            return 0
+
+        headers = {}
+        if offset:
+            _logger.info(f"resume download of file {job_.uri} from byte {offset}")
+            headers["Range"] = f"bytes={offset}-"
+        else:
+            _logger.info(f"downloading file {job_.uri} on {job_.fileout}")
+        job_.writeJournal()
+
+        start = time.monotonic()
+        try:
+            # an authorised request.
+            r = http_.get(job_.url, cookies=cookies, headers=headers, stream=True)
+            if r.status_code == 416:
+                # Range Not Satisfiable, download whole file again
+                r.close()
+                offset = 0
+                r = http_.get(job_.url, cookies=cookies, stream=True)
+            elif r.status_code == 206 and _rangeStart(r) != offset:
+                # partial content does not follow bytes already downloaded
+                _logger.warning(
+                    f"server answers Content-Range -{r.headers.get('Content-Range')}- "
+                    f"to Range from byte {offset}, download whole file again"
+                )
+                r.close()
+                offset = 0
+                r = http_.get(job_.url, cookies=cookies, stream=True)
+            # If the response was successful, no Exception will be raised
+            r.raise_for_status()
+        except HTTPError as http_err:
+            # https://en.wikipedia.org/wiki/List_of_HTTP_status_codes
+            _logger.exception(f"HTTP error occurred: {http_err}")
+            raise  #
+        except Exception as err:
+            _logger.exception(f"Other error occurred: {err}")
+            raise  #
+        else:
+            # Success!
+            if offset and r.status_code != 206:
+                _logger.info("server does not support Range request, download whole file")
+                offset = 0
+            h = None
+            if job_.sha256 is not None:
+                h = hashlib.sha256()
+                if offset:
+                    # resumed download: hash bytes downloaded by previous run
+                    _hashFile(job_.part, h, self._buffer)
+            if job_.transform is None:
+                with r, open(job_.part, "ab" if offset else "wb", buffering=0) as f:
+                    nbytes = self._write(r, f, h)
+                self._accept(job_, h.hexdigest() if h is not None else None)
+            else:
+                with r, open(job_.part, "w", encoding="utf-8", newline="") as f:
+                    nbytes = self._transform(r, f, h, job_)
+                self._accept(job_, h.hexdigest() if h is not None else None, nbytes)
+
+            elapsed = max(time.monotonic() - start, 1e-9)
+            _logger.info(
+                f"download completed, output on {job_.fileout} "
+                f"[{nbytes / _MB:.1f} MB in {elapsed:.1f} s, {nbytes / _MB / elapsed:.2f} MB/s]"
+            )
+            return nbytes
+
+    def _write(self, r_, f_, hash_=None):
+        """write response body in file, update hash_ on the fly
+
+        :return: number of bytes written
+        """
+        nbytes = 0
+        if r_.headers.get("Content-Encoding", "identity") == "identity":
+            # read raw stream into one reused buffer
+            buf = memoryview(bytearray(self._buffer))
+            for n in iter(lambda: r_.raw.readinto(buf), 0):
+                f_.write(buf[:n])
+                if hash_ is not None:
+                    hash_.update(buf[:n])
+                nbytes += n
+        else:
+            # compressed stream, let requests decode it
+            for chunk in r_.iter_content(chunk_size=self._buffer):
+                if chunk:  # filter out keep-alive new chunks
+                    f_.write(chunk)
+                    if hash_ is not None:
+                        hash_.update(chunk)
+                    nbytes += len(chunk)
+        return nbytes
+
+    def _transform(self, r_, f_, hash_, job_):
+        """decode response body, apply job transform, and write result in file
+
+        hash_ is updated with the original bytes
+
+        :return: number of bytes downloaded
+        """
+        # let urllib3 decode compressed stream
+        r_.raw.decode_content = True
+        raw = _HashReader(r_.raw, hash_)
+        text = io.TextIOWrapper(
+            io.BufferedReader(raw, self._buffer), encoding="utf-8", newline=""
+        )
+        job_.transform(text, f_, job_.filename)
+        return raw.nbytes
+
+    def _reuse(self, job_):
+        """link file already on disk with the expected content, instead of downloading it
+
+        :return: True if file is reused
+        """
+        if self._store is None or job_.key is None:
+            return False
+
+        if self._store.has(job_.key):
+            _logger.info(f"file {job_.uri} found in store, link it on {job_.fileout}")
+            self._store.linkTo(job_.key, job_.fileout)
+            return True
+
+        # file downloaded before the store was set up
+        # Note: file referenced in store was linked from it, then changed (see csv4Erddap)
+        if (
+            job_.transform is None
+            and not self._store.reference(job_.fileout).is_file()
+            and job_.fileout.is_file()
+            and (job_.size is None or job_.fileout.stat().st_size == job_.size)
+            and _sha256(job_.fileout, self._buffer) == job_.sha256
+        ):
+            _logger.info(f"file {job_.uri} already on {job_.fileout}, add it to store")
+            self._store.ingest(job_.fileout, job_.key)
+            return True
+
+        return False
+
+    def _accept(self, job_, sha256_=None, size_=None):
+        """check size, and sha256 of partial file, and rename it as final file
+
+        :param sha256_: sha256 computed while downloading [default: read partial file]
+        :param size_: bytes downloaded, if they differ from the partial file [default: size of partial file]
+        """
+        size = size_ if size_ is not None else job_.part.stat().st_size
+        if job_.size is not None and size != job_.size:
+            # Note: partial file is kept, to be resumed
+            raise IOError(
+                f"size of downloaded file {job_.part} -{size}- differs from expected one -{job_.size}-"
+            )
+        if job_.sha256 is not None:
+            sha256 = sha256_
+            if sha256 is None:
+                sha256 = _sha256(job_.part, self._buffer)
+            if sha256 != job_.sha256:
+                job_.part.unlink()
+                job_.journal.unlink()
+                raise IOError(
+                    f"sha256 of downloaded file {job_.part} -{sha256}- differs from expected one -{job_.sha256}-"
+                )
+        # atomic rename
+        os.replace(job_.part, job_.fileout)
+        job_.journal.unlink()
+
+        if self._store is not None and job_.key is not None:
+            self._store.ingest(job_.fileout, job_.key)
+
+    def preflight(self, jobs_):
+        """check there is enough free disk space to download jobs_, raise IOError otherwise
+
+        files already in store, and bytes already downloaded in partial files, are not counted.
+        files are counted on store file system too, if not the one of dataset directory.
+        files of unknown size are not counted either.
+        """
+        # bytes needed per file system {device: [path, bytes], ...}
+        need = {}
+        unknown = 0
+        store = None
+        if self._store is not None:
+            store = self._store.device()
+        for job in jobs_:
+            if (
+                self._store is not None
+                and job.key is not None
+                and self._store.has(job.key)
+            ):
+                continue
+            if job.size is None:
+                unknown += 1
+                continue
+            device = job.dirout.stat().st_dev
+            _ = need.setdefault(device, [job.dirout, 0])
+            _[1] += job.size - job.resumeFrom()
+            if store is not None and job.key is not None and store[0] != device:
+                # Note: file is copied into store, as hard link is not possible
+                _ = need.setdefault(store[0], [store[1], 0])
+                _[1] += job.size
+
+        if unknown:
+            _logger.warning(
+                f"size of {unknown} file(s) unknown, not checked against free disk space"
+            )
+        for path, nbytes in need.values():
+            free = shutil.disk_usage(path).free
+            _logger.info(
+                f"disk space needed on {path}: {nbytes / _MB:.1f} MB, free: {free / _MB:.1f} MB"
+            )
+            if nbytes > free:
+                raise IOError(
+                    f"not enough free disk space on {path}: "
+                    f"{nbytes / _MB:.1f} MB needed, {free / _MB:.1f} MB free"
+                )
+
+    def iterRun(self, jobs_):
+        """download every file of jobs_, newest and smallest first (see schedule)
+
+        yield each file as soon as it is downloaded, while others keep downloading.
+        Note: raise first error met, once every download is over
+
+        :param jobs_: list of Job
+        :return: generator of (filename, dirout)
+        """
+        self.nbytes = 0
+        if not jobs_:
+            return
+
+        self.preflight(jobs_)
+        jobs = schedule(jobs_)
+
+        # use session shared by entry points, if any (see session.py)
+        _session = session.get()
+        if _session is not None:
+            # Note: otherwise connections above pool size are dropped, and opened again
+            _session.poolsize(self._workers)
+            http = _session.http
+        else:
+            http = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=self._workers, pool_maxsize=self._workers
+            )
+            http.mount("https://", adapter)
+
+        start = time.monotonic()
+        first = None
+        error = None
+        pool = ThreadPoolExecutor(max_workers=self._workers)
+        futures = {}
+        try:
+            # Note: pool starts jobs in submission order
+            futures = {pool.submit(self._fetch, http, job): job for job in jobs}
+            for f in as_completed(futures):
+                job = futures[f]
+                try:
+                    self.nbytes += f.result()
+                except Exception as err:
+                    if error is None:
+                        error = err
+                    continue
+                if first is None:
+                    first = time.monotonic() - start
+                    _logger.info(f"first file {job.filename} ready after {first:.1f} s")
+                yield job.filename, job.dirout
+        finally:
+            # Note: if consumer stops (error, or generator closed), do not wait for
+            # pending downloads, only for those already running
+            for f in futures:
+                f.cancel()
+            pool.shutdown(wait=True)
+            if _session is None:
+                http.close()
+
+        elapsed = max(time.monotonic() - start, 1e-9)
+        _logger.info(
+            f"{len(jobs_)} file(s) downloaded with {self._workers} worker(s): "
+            f"{self.nbytes / _MB:.1f} MB in {elapsed:.1f} s, {self.nbytes / _MB / elapsed:.2f} MB/s"
+        )
+        if error is not None:
+            raise error
+
+    def run(self, jobs_):
+        """download every file of jobs_
+
+        :param jobs_: list of Job
+        :return: dictionary with filename as key, and dirout as value (in jobs_ order)
+        """
+        d = {job.filename: job.dirout for job in jobs_}
+        for _ in self.iterRun(jobs_):
+            pass
+        return d
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
+
+# See PyCharm help at https://www.jetbrains.com/help/pycharm/
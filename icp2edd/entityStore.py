@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# entityStore.py
+
+"""
+    This module set up a persistent store of ICOS CP entities' metadata.
+
+    Entities (stations, organizations, persons, licences, ...) are shared by almost every DataObject.
+    Their metadata, as grouped by ICPObj.getMeta, are kept from one run to another, keyed by URI.
+
+    Example usage:
+
+    from entityStore import EntityStore
+
+    store = EntityStore(path, ttl)      # open store
+    binding = store.get(uri)            # get metadata of uri, if not expired
+    store.put(objtype, meta)            # store metadata {uri: binding, ...} of objects of type objtype
+    store.close()                       # close store
+"""
+
+# --- import -----------------------------------
+# import from standard lib
+import datetime as dt
+import json
+import logging
+import sqlite3
+import time
+from pathlib import Path
+
+# import from other lib
+from dateutil.parser import parse
+from SPARQLWrapper.SmartWrapper import Value as SmartWrapperValue
+
+# import from my project
+import icp2edd.util as util
+from icp2edd.icpobj import cpmeta
+
+# --- module's variable ------------------------
+# load logger
+_logger = logging.getLogger(__name__)
+
+# default time to live (in days), used for class not listed in ttl
+_default_ttl = 1
+
+
+# ----------------------------------------------
+def _toBinding(v_):
+    """convert SPARQLWrapper Value into binding dictionary"""
+    binding = {"type": v_.type, "value": v_.value}
+    if v_.lang is not None:
+        binding["xml:lang"] = v_.lang
+    if v_.datatype is not None:
+        binding["datatype"] = v_.datatype
+    return binding
+
+
+def dumps(binding_):
+    """
+    serialise binding {variable: [SPARQLWrapper.Value, ...], ...} as json string
+
+    >>> binding = {'label': [SmartWrapperValue('label', {'type': 'literal', 'value': 'x'})]}
+    >>> dumps(binding)
+    '{"label": [{"type": "literal", "value": "x"}]}'
+    >>> loads(dumps(binding)) == binding
+    True
+    """
+    return json.dumps(
+        {k: [_toBinding(v) for v in lv] for k, lv in binding_.items()},
+        sort_keys=True,
+    )
+
+
+def loads(str_):
+    """deserialise json string as binding {variable: [SPARQLWrapper.Value, ...], ...}"""
+    return {k: [SmartWrapperValue(k, v) for v in lv] for k, lv in json.loads(str_).items()}
+
+
+def _utc(datestr_):
+    """parse date, assume UTC if no time zone given"""
+    _ = parse(datestr_)
+    if _.tzinfo is None:
+        _ = _.replace(tzinfo=dt.timezone.utc)
+    return _
+
+
+# ----------------------------------------------
+class EntityStore(object):
+    """ """
+
+    def __init__(self, filename_, ttl_=None):
+        """open (or create) persistent store of ICOS CP entities' metadata.
+
+        time to live is given per class, in days.
+        It applies to every subclass of the class, unless the subclass is listed too.
+        Class not listed get the 'default' time to live.
+        A time to live of 0 means object of this class are never stored.
+
+        Example:
+            EntityStore('entity.sqlite', {'default': 1, 'cpmeta.Station': 30})
+
+        :param filename_: store filename
+        :param ttl_: dictionary of time to live {objtype: days, ...}
+        """
+        if not isinstance(filename_, Path):
+            filename_ = Path(filename_)
+
+        if ttl_ is None:
+            ttl_ = {}
+        if not isinstance(ttl_, dict):
+            raise TypeError(f"Invalid type value, ttl -{ttl_}- must be dictionary")
+
+        self._filename = filename_
+        self._ttl = {k: float(v) for k, v in ttl_.items()}
+        self._ttl.setdefault("default", _default_ttl)
+        # time to live (in seconds) of each object type
+        self._ttlType = {}
+
+        self._filename.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self._filename))
+        self._db.executescript(
+            """
+            create table if not exists entity (
+                uri     text primary key,
+                objtype text,
+                fetched real,
+                meta    text
+            );
+            create table if not exists objtype (
+                uri     text primary key,
+                objtype text
+            );
+            create table if not exists mark (
+                key     text primary key,
+                value   text
+            );
+            create table if not exists dataset (
+                name    text primary key,
+                uri     text
+            );
+            create table if not exists flat (
+                uri     text primary key,
+                kind    text,
+                id      text,
+                attrs   text,
+                deps    text,
+                refs    text
+            );
+            """
+        )
+        self._db.commit()
+        #
+        self.hits = 0
+        self.misses = 0
+        # uri which metadata changed (or are new) during this run
+        self.changed = set()
+
+    def _getTtl(self, objtype_):
+        """return time to live (in seconds) of object type
+
+        look for objtype_, then for each of its parent class, otherwise use 'default'
+        """
+        if objtype_ not in self._ttlType:
+            ttl = self._ttl["default"]
+            klass = globals().get(objtype_)
+            if klass is not None:
+                # Note: last class is 'object'
+                for k in klass.__mro__[:-1]:
+                    if util.classKey(k) in self._ttl:
+                        ttl = self._ttl[util.classKey(k)]
+                        break
+            self._ttlType[objtype_] = ttl * 86400
+        return self._ttlType[objtype_]
+
+    def get(self, uri_):
+        """return metadata binding of uri_, None if unknown or expired
+
+        :param uri_: ICOS CP uri
+        :return: {variable: [SPARQLWrapper.Value, ...], ...}
+        """
+        row = self._db.execute(
+            "select objtype, fetched, meta from entity where uri = ?", (uri_,)
+        ).fetchone()
+        if row is not None:
+            objtype, fetched, meta = row
+            if time.time() - fetched < self._getTtl(objtype):
+                self.hits += 1
+                return loads(meta)
+            _logger.debug(f"cached metadata of {uri_} expired")
+        self.misses += 1
+        return None
+
+    def put(self, objtype_, meta_):
+        """store metadata of objects of type objtype_
+
+        :param objtype_: object type ('cpmeta.Station')
+        :param meta_: {uri: binding, ...} as ICPObj.meta
+        """
+        self.putType({uri: objtype_ for uri in meta_})
+        if self._getTtl(objtype_) <= 0:
+            self.changed.update(meta_)
+            return
+        now = time.time()
+        rows = []
+        for uri, binding in meta_.items():
+            meta = dumps(binding)
+            row = self._db.execute(
+                "select meta from entity where uri = ?", (uri,)
+            ).fetchone()
+            if row is None or row[0] != meta:
+                self.changed.add(uri)
+            rows.append((uri, objtype_, now, meta))
+        self._db.executemany(
+            "insert or replace into entity (uri, objtype, fetched, meta) values (?, ?, ?, ?)",
+            rows,
+        )
+        self._db.commit()
+
+    def isFresh(self, uri_):
+        """check metadata of uri_ are stored, and not expired"""
+        row = self._db.execute(
+            "select objtype, fetched from entity where uri = ?", (uri_,)
+        ).fetchone()
+        return row is not None and time.time() - row[1] < self._getTtl(row[0])
+
+    def getType(self, uri_):
+        """return object type of uri_, raise KeyError if unknown
+
+        Note: object type of an uri never change, so it never expire
+        """
+        row = self._db.execute(
+            "select objtype from objtype where uri = ?", (uri_,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(uri_)
+        return row[0]
+
+    def putType(self, types_):
+        """store object type of each uri
+
+        :param types_: {uri: objtype, ...}
+        """
+        self._db.executemany(
+            "insert or replace into objtype (uri, objtype) values (?, ?)",
+            list(types_.items()),
+        )
+        self._db.commit()
+
+    def invalidate(self, uris_):
+        """remove metadata of every uri in uris_, and dataset name pointing to them"""
+        self._db.executemany(
+            "delete from entity where uri = ?", [(uri,) for uri in uris_]
+        )
+        self._db.executemany(
+            "delete from dataset where uri = ?", [(uri,) for uri in uris_]
+        )
+        self._db.commit()
+
+    def getDataset(self, name_):
+        """return uri of the last version of dataset file 'name_', None if unknown"""
+        row = self._db.execute(
+            "select uri from dataset where name = ?", (name_,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def putDataset(self, names_):
+        """store uri of the last version of each dataset file
+
+        :param names_: {name: uri, ...}
+        """
+        self._db.executemany(
+            "insert or replace into dataset (name, uri) values (?, ?)",
+            list(names_.items()),
+        )
+        self._db.commit()
+
+    def getFlat(self, uri_):
+        """return flattened attributes of uri_ stored during a previous run, None if unknown
+
+        :return: dictionary {'kind': 'DataObject', 'id': id, 'attrs': {}, 'deps': [uri, ...], 'refs': [uri, ...]}
+        """
+        row = self._db.execute(
+            "select kind, id, attrs, deps, refs from flat where uri = ?", (uri_,)
+        ).fetchone()
+        if row is None:
+            return None
+        kind, id_, attrs, deps, refs = row
+        return {
+            "kind": kind,
+            "id": id_,
+            "attrs": json.loads(attrs),
+            "deps": json.loads(deps),
+            "refs": json.loads(refs),
+        }
+
+    def putFlat(self, uri_, kind_, id_, attrs_, deps_, refs_):
+        """store flattened attributes of uri_
+
+        :param uri_: ICOS CP uri of DataObject or DatasetColumn
+        :param kind_: 'DataObject' or 'DataVariable'
+        :param id_: datasetID or variable name
+        :param attrs_: flattened attributes {attribute: [value, ...], ...}
+        :param deps_: list of uri, which metadata are used to flatten attributes
+        :param refs_: list of uri of DatasetColumn flattened on their own
+        """
+        self._db.execute(
+            "insert or replace into flat (uri, kind, id, attrs, deps, refs) values (?, ?, ?, ?, ?, ?)",
+            (
+                uri_,
+                kind_,
+                id_,
+                json.dumps(attrs_),
+                json.dumps(sorted(deps_)),
+                json.dumps(sorted(refs_)),
+            ),
+        )
+        self._db.commit()
+
+    def invalidateSubmitted(self, submfrom_):
+        """remove metadata of DataObjects submitted since 'submfrom_', and of their previous versions
+
+        Those objects changed, or get a new version, since 'submfrom_'.
+        'submfrom_' is the end of the last update (see update.log), however if the store was not
+        synchronised since then, the oldest date is used.
+
+        :param submfrom_: submitted from date ( '2020-01-01T00:00:00.000Z' )
+        """
+        dates = [d for d in (submfrom_, self._getMark("submitted")) if d]
+        if dates:
+            since = min(dates, key=_utc)
+            _ = cpmeta.DataObject(submfrom=since)
+            uris = _.listSubmitted()
+            _logger.info(
+                f"invalidate {len(uris)} cached DataObject(s) submitted since {since}"
+            )
+            self.invalidate(uris)
+
+        self._setMark("submitted", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+
+    def resetOnChange(self, key_, value_):
+        """remove every stored metadata, and flattened attributes, if value_ changed since last run
+
+        Used for settings that change the metadata requested (ex: crawl policy)
+
+        :param key_: setting name ('crawl')
+        :param value_: setting value, as string
+        """
+        previous = self._getMark(key_)
+        if previous is not None and previous != value_:
+            _logger.info(f"{key_} changed since last run, clear entity cache")
+            self._db.execute("delete from entity")
+            self._db.execute("delete from flat")
+            self._db.commit()
+        self._setMark(key_, value_)
+
+    def _getMark(self, key_):
+        """ """
+        row = self._db.execute(
+            "select value from mark where key = ?", (key_,)
+        ).fetchone()
+        return row[0] if row is not None else None
+
+    def _setMark(self, key_, value_):
+        """ """
+        self._db.execute(
+            "insert or replace into mark (key, value) values (?, ?)", (key_, value_)
+        )
+        self._db.commit()
+
+    def close(self):
+        """ """
+        _logger.info(
+            f"entity cache {self._filename}: {self.hits} hit(s), {self.misses} miss(es)"
+        )
+        self._db.close()
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
+
+# See PyCharm help at https://www.jetbrains.com/help/pycharm/
@@ -9,6 +9,7 @@ import datetime
 import logging
 import os
 import re
+from contextlib import nullcontext
 from copy import deepcopy
 from importlib import import_module
 from inspect import isclass
@@ -26,6 +27,7 @@ from requests.exceptions import HTTPError
 
 # import from my project
 import icp2edd.icpobj
+import icp2edd.session as session
 import icp2edd.setupcfg as setupcfg
 from icp2edd.icpobj import *  # see __all__ in icpobj/__init__.py
 from icp2edd.icpobj.subproperties import hasSubProp
@@ -436,6 +438,7 @@ class IcpOnto(Onto):
         # recursively read properties of each object
         # if prop not already listed in object's prop, add it
         superObj.getClassProperties()
+        superObj.close()
         #
         _ = self.classHasProperty
         for k, lv in superObj.classprop.items():
@@ -462,7 +465,11 @@ class IcpOnto(Onto):
             fileout.replace(str(fileout) + "." + dt)
 
         # Use 'with' to ensure the session context is closed after use.
-        with requests.Session() as s:
+        # Note: shared session (see session.py) is closed by its owner
+        _session = session.get()
+        with (
+            requests.Session() if _session is None else nullcontext(_session.http)
+        ) as s:
             try:
                 r = s.get(str(self._uri), cookies=cookies, stream=True)
                 # If the response was successful, no Exception will be raised
@@ -24,12 +24,12 @@ from pathlib import Path
 from pprint import pformat
 
 # import from other lib
-import requests
-from requests.exceptions import HTTPError
 from SPARQLWrapper.SmartWrapper import Value as SmartWrapperValue
 
 # import from my project
+import icp2edd.csv4Erddap as c4edd
 import icp2edd.setupcfg as setupcfg
+from icp2edd.downloader import Downloader, Job
 from icp2edd.icpobj.cpmeta.staticObject import StaticObject
 
 # --- module's variable ------------------------
@@ -163,24 +163,12 @@ class DataObject(StaticObject):
             #
             _logger.info(f"self.meta[{uri}].doi: {_['doi']}")
 
-    def download(self):
-        """download file associated to dataobject
-
-        download every file associated with the dataobjects selected on ICOS CP,
-        and store them on a temporary directory named by the dataset 'name'
-
-        :return: dictionary with csv file as key, and dirout as value
-
-        >>> t.getMeta()
-        >>> output = t.download()
-        download file  https://meta.icos-cp.eu/objects/uwXo3eDGipsYBv0ef6H2jJ3Z  on
-            .../58GS20190711_SOCAT_enhanced/58GS20190711_SOCAT_enhanced.csv
-        """
-        d = {}
+    def _jobs(self):
+        """return list of Job, one per file associated with the dataobjects selected"""
+        jobs = {}
         for uri, binding in self.meta.items():
             # there is at least one binding covering the optional "opt", too
             # uri = binding['uri'].value  # Warning do not convert to Path (https:// => https./)
-            pid = uri.split("/")[-1]
             # Warning: linked to staticObject.py 'cpmeta:hasName': 'filename'
             if "filename" not in binding:
                 _logger.critical(
@@ -204,53 +192,61 @@ class DataObject(StaticObject):
                     # directory already exists
                     pass
 
-                url = str(uri).replace("meta", "data")
-                fileout = dirout / filename
-                if filename not in d:
+                if filename not in jobs:
                     # download
-                    d[filename] = dirout
-
-                    cookies = dict(CpLicenseAcceptedFor=pid)
-                    # Fill in your details here to be posted to the login form.
-                    # user, pswd = 'julien.paul at uib.no', 'Lw9ucQr5EEQ9SaK'
-
-                    # Use 'with' to ensure the session context is closed after use.
-                    _logger.info(f"downloading file {uri} on {fileout}")
-                    with requests.Session() as s:
-                        # LOGIN_URL = 'https://cpauth.icos-cp.eu/login/'
-                        # p = s.post(LOGIN_URL, data={user : pswd})
-                        # print the html returned or something more intelligent to see if it's a successful login page.
-                        # print('html return ')#, p.text)
-
-                        # TODO use this 'try except else' format everywhere
-                        try:
-                            # an authorised request.
-                            # r = s.get(url, auth=(user,pswd), stream=True)
-                            # r = s.get(url, auth=HTTPDigestAuth(user, pswd), stream=True)
-                            r = s.get(str(url), cookies=cookies, stream=True)
-                            # If the response was successful, no Exception will be raised
-                            r.raise_for_status()
-                        except HTTPError as http_err:
-                            # https://en.wikipedia.org/wiki/List_of_HTTP_status_codes
-                            # raise HTTPError(f'HTTP error occurred: {http_err}')  # Python 3.6
-                            _logger.exception(f"HTTP error occurred: {http_err}")
-                            raise  #
-                        except Exception as err:
-                            # raise Exception(f'Other error occurred: {err}')  # Python 3.6
-                            _logger.exception(f"Other error occurred: {err}")
-                            raise  #
-                        else:
-                            # Success!
-                            _logger.info(f"download completed, output on {fileout}")
-                            # perc = float(i) / ?? * 100
-                            # print(f'downloading file {uri} [{perc}%] on {fileout}', end='')
-                            # print('Downloading File FooFile.txt [%d%%]\r'%i, end="")
-                            with open(fileout, "wb") as f:
-                                for chunk in r.iter_content(chunk_size=1024):
-                                    if chunk:  # filter out keep-alive new chunks
-                                        f.write(chunk)
-
-        return d
+                    # Warning: linked to staticObject.py
+                    # - 'cpmeta:hasSizeInBytes': 'size_in_bites'
+                    # - 'cpmeta:hasSha256sum': 'sha256_sum'
+                    # Warning: linked to icpObj.py 'terms:dateSubmitted': 'date_submitted'
+                    size = None
+                    if "size_in_bites" in binding:
+                        size = binding["size_in_bites"][0].value
+                    sha256 = None
+                    if "sha256_sum" in binding:
+                        sha256 = binding["sha256_sum"][0].value
+                    submitted = None
+                    if "date_submitted" in binding:
+                        submitted = binding["date_submitted"][0].value
+                    transform = None
+                    if setupcfg.downloadTransform and setupcfg.transformStats:
+                        transform = c4edd.modifyStreamStats
+                    elif setupcfg.downloadTransform:
+                        transform = c4edd.modifyStream
+                    jobs[filename] = Job(
+                        uri, filename, dirout, size, sha256, transform, submitted
+                    )
+
+        return list(jobs.values())
+
+    def _downloader(self):
+        """ """
+        return Downloader(
+            setupcfg.downloadWorkers, setupcfg.downloadStore, setupcfg.downloadBuffer
+        )
+
+    def download(self):
+        """download file associated to dataobject
+
+        download every file associated with the dataobjects selected on ICOS CP,
+        and store them on a temporary directory named by the dataset 'name'
+
+        :return: dictionary with csv file as key, and dirout as value
+
+        >>> t.getMeta()
+        >>> output = t.download()
+        download file  https://meta.icos-cp.eu/objects/uwXo3eDGipsYBv0ef6H2jJ3Z  on
+            .../58GS20190711_SOCAT_enhanced/58GS20190711_SOCAT_enhanced.csv
+        """
+        return self._downloader().run(self._jobs())
+
+    def iterDownload(self):
+        """download file associated to dataobject, newest and smallest first
+
+        yield each file as soon as it is downloaded, while others keep downloading
+
+        :return: generator of (csv file, dirout)
+        """
+        yield from self._downloader().iterRun(self._jobs())
 
 
 if __name__ == "__main__":
@@ -178,6 +178,11 @@ class ICPObj(object):
         # dictionary to store metadata
         self.meta = {}
 
+        # properties to be requested (None if all), and properties not to be requested
+        # see crawlPolicy.py
+        self._keep = None
+        self._prune = set()
+
         # object type URI
         # self._object = 'http://meta.icos-cp.eu/ontologies/cpmeta/DataObject'
         self._object = None
@@ -232,6 +237,9 @@ class ICPObj(object):
         select = f"select ?uri"
         option = ""
         for k, v in self.attr.items():
+            if k in self._prune or (self._keep is not None and k not in self._keep):
+                # property pruned by crawl policy
+                continue
             select = select + " ?" + v
             option = option + "\n\tOPTIONAL { ?uri %s ?%s .}" % (k, v)
 
@@ -396,6 +404,33 @@ class ICPObj(object):
         else:
             raise TypeError(f"Invalid object format: {self._uri}")
 
+    def listProperties(self, uris_):
+        """return properties associated to each uri of uris_, in one query
+
+        :param uris_: list of ICOS CP uri
+        :return: dictionary {uri: {property, ...}, ...}
+        """
+        for uri in uris_:
+            if not self._is_url(uri):
+                raise TypeError(f"Invalid object format: {uri}")
+
+        queryString = """
+            select distinct ?uri ?property
+            where{
+             VALUES ?uri { %s }
+             ?uri ?property ?x
+            }
+            """ % " ".join(
+            f"<{uri}>" for uri in uris_
+        )
+
+        res = self._query(queryString)
+        props = {uri: set() for uri in uris_}
+        for r in res.bindings:
+            props[r["uri"].value].add(r["property"].value)
+
+        return props
+
     def getMeta(self):
         """
         fill instance's dictionary _meta (keys are: 'type','value')
@@ -748,6 +783,58 @@ class ICPObj(object):
         else:
             return ""
 
+    def listSubmitted(self):
+        """return uri on ICOS CP of objects submitted since 'submfrom' (until 'submuntil'),
+        and uri of their previous versions"""
+        if self._is_url(self._object):
+            queryString = """
+            select ?uri ?prev
+            where{
+             ?uri rdf:type <%s> ;
+                 cpmeta:wasSubmittedBy/prov:endedAtTime ?submTime .
+             %s
+             %s
+             OPTIONAL { ?uri cpmeta:isNextVersionOf ?prev }
+            }
+            """ % (
+                self._object,
+                self._filterSubmTime(self._from, op_=">="),
+                self._filterSubmTime(self._until, op_="<="),
+            )
+        else:
+            raise TypeError(f"Invalid object format: {self._object}")
+
+        res = self._query(queryString)
+        uris = set()
+        for r in res.bindings:
+            uris.update(v.value for v in r.values())
+        return sorted(uris)
+
+    def listPreviousVersion(self, uris_):
+        """return previous versions of objects uris_, with their filename
+
+        every previous version is listed, not only the last one (cpmeta:isNextVersionOf+)
+
+        :param uris_: list of uri on ICOS CP
+        :return: dictionary {previous uri: (uri, previous filename), ...}
+        """
+        if not uris_:
+            return {}
+
+        queryString = """
+        select ?uri ?prev ?name
+        where{
+         VALUES ?uri { %s }
+         ?uri cpmeta:isNextVersionOf+ ?prev .
+         ?prev cpmeta:hasName ?name .
+        }
+        """ % " ".join(f"<{uri}>" for uri in uris_)
+
+        res = self._query(queryString)
+        return {
+            r["prev"].value: (r["uri"].value, r["name"].value) for r in res.bindings
+        }
+
 
 if __name__ == "__main__":
     import doctest
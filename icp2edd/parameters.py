@@ -13,6 +13,7 @@ import yaml
 
 # import from my project
 import icp2edd.setupcfg as setupcfg
+from icp2edd.crawlPolicy import list_predicate_mode
 
 # --- module's variable ------------------------
 # load logger
@@ -53,12 +54,14 @@ def _get_list(list_=None):
 def _check_param_attributes_keep(dict_=None):
     """ """
     # default 'keep' dictionary
-    _ = {"icoscp": _get_list(), "erddap": _get_list()}
+    _ = {"icoscp": _get_list(), "erddap": _get_list(), "stats": _get_list()}
 
     if "icoscp" in dict_:
         _["icoscp"] = _get_list(dict_["icoscp"])
     if "erddap" in dict_:
         _["erddap"] = _get_list(dict_["erddap"])
+    if "stats" in dict_:
+        _["stats"] = _get_list(dict_["stats"])
 
     return _
 
@@ -128,6 +131,100 @@ def _check_param_attributes(dict_):
     return _
 
 
+def _check_param_crawl_depth(int_=None):
+    """ """
+    if int_ is None:
+        return None
+    else:
+        if not isinstance(int_, int) or isinstance(int_, bool) or int_ < 0:
+            _logger.exception(
+                f"Invalid crawl depth -{int_}-. Depth must be a positive integer."
+                f"Check {setupcfg.extraParam}."
+            )
+            raise
+        else:
+            return int_
+
+
+def _check_param_crawl_rules(dict_=None):
+    """ """
+    if dict_ is None:
+        return {}
+    else:
+        if not isinstance(dict_, dict):
+            _logger.exception(
+                f"Invalid crawl rules type -{dict_}-. rules must be a dictionary."
+                f"Check {setupcfg.extraParam}."
+            )
+            raise
+        else:
+            _ = {}
+            for objtype, modes in dict_.items():
+                if modes is None:
+                    modes = {}
+                if not isinstance(modes, dict) or set(modes) - {"include", "exclude"}:
+                    _logger.exception(
+                        f"Invalid crawl rules of -{objtype}-. "
+                        f"rules must be a dictionary with keys 'include' and/or 'exclude'."
+                        f"Check {setupcfg.extraParam}."
+                    )
+                    raise
+                _[objtype] = {
+                    "include": _get_list(modes.get("include")),
+                    "exclude": _get_list(modes.get("exclude")),
+                }
+            return _
+
+
+def _check_param_crawl_predicates(dict_=None):
+    """ """
+    if dict_ is None:
+        return {}
+    else:
+        if not isinstance(dict_, dict):
+            _logger.exception(
+                f"Invalid crawl predicates type -{dict_}-. predicates must be a dictionary."
+                f"Check {setupcfg.extraParam}."
+            )
+            raise
+        else:
+            for attr, mode in dict_.items():
+                if mode not in list_predicate_mode:
+                    _logger.exception(
+                        f"Invalid crawl predicate mode -{mode}- of -{attr}-. "
+                        f"mode must be one of {list_predicate_mode}."
+                        f"Check {setupcfg.extraParam}."
+                    )
+                    raise
+            return dict_
+
+
+def _check_param_crawl(dict_):
+    """ """
+    # default empty dictionary
+    _ = {}
+
+    # check depth
+    if "depth" in dict_:
+        _["depth"] = _check_param_crawl_depth(dict_["depth"])
+    else:
+        _["depth"] = _check_param_crawl_depth()
+
+    # check rules
+    if "rules" in dict_:
+        _["rules"] = _check_param_crawl_rules(dict_["rules"])
+    else:
+        _["rules"] = _check_param_crawl_rules({})
+
+    # check predicates
+    if "predicates" in dict_:
+        _["predicates"] = _check_param_crawl_predicates(dict_["predicates"])
+    else:
+        _["predicates"] = _check_param_crawl_predicates({})
+
+    return _
+
+
 def _check_param(dict_):
     """
     check dictionary elements and reformat if need be
@@ -142,6 +239,11 @@ def _check_param(dict_):
     else:
         _["attributes"] = _check_param_attributes({})
 
+    if "crawl" in dict_ and dict_["crawl"] is not None:
+        _["crawl"] = _check_param_crawl(dict_["crawl"])
+    else:
+        _["crawl"] = _check_param_crawl({})
+
     return _
 
 
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# progress.py
+
+"""
+    This module set up a progress telemetry of ICOS CP crawl, and repack.
+
+    It tracks objects visited (per crawl level), queries issued, cache hits, queue depth and throughput.
+    On a terminal, a compact status line is refreshed in place.
+    Otherwise (cron, redirection), a structured log record is emitted periodically.
+
+    Example usage:
+
+    from progress import Progress
+
+    progress = Progress()
+    progress.start("crawl", total)  # start phase, with total number of DataObjects
+    progress.visit(level, queue)    # object visited at crawl level, with queue depth
+    progress.query()                # query sent to ICOS CP
+    progress.hit()                  # metadata read from cache
+    progress.done()                 # DataObject done
+    progress.stop()                 # end phase, log summary
+"""
+
+# --- import -----------------------------------
+# import from standard lib
+import logging
+import sys
+import time
+
+# import from other lib
+# import from my project
+
+# --- module's variable ------------------------
+# load logger
+_logger = logging.getLogger(__name__)
+
+# minimum time (in seconds) between two status line refresh on terminal
+_tty_interval = 0.2
+# time (in seconds) between two log records, when not on terminal
+_log_interval = 30
+
+
+# ----------------------------------------------
+class Progress(object):
+    """ """
+
+    def __init__(self, enable_=True, stream_=None):
+        """initialise progress telemetry
+
+        :param enable_: render status line, and log records
+        :param stream_: stream where render status line [default: sys.stdout]
+        """
+        if stream_ is None:
+            stream_ = sys.stdout
+
+        self._enable = enable_
+        self._stream = stream_
+        self._tty = hasattr(stream_, "isatty") and stream_.isatty()
+        #
+        self.phase = None
+        self.total = None
+        self._width = 0
+        self._reset()
+
+    def _reset(self):
+        """ """
+        self.processed = 0
+        self.queries = 0
+        self.hits = 0
+        self.queue = 0
+        # objects visited per crawl level
+        self.levels = {}
+        self._start = time.monotonic()
+        self._last = self._start
+
+    def start(self, phase_, total_=None):
+        """start phase phase_ ('crawl', 'repack', ...)
+
+        :param total_: number of DataObjects to be processed
+        """
+        if self.phase is not None:
+            self.stop()
+        self.phase = phase_
+        self.total = total_
+        self._reset()
+
+    def visit(self, level_=0, queue_=None):
+        """object visited at crawl level level_, with queue_ objects still to visit"""
+        self.levels[level_] = self.levels.get(level_, 0) + 1
+        if queue_ is not None:
+            self.queue = queue_
+        self._tick()
+
+    def query(self, n_=1):
+        """n_ queries sent to ICOS CP"""
+        self.queries += n_
+        self._tick()
+
+    def hit(self, n_=1):
+        """n_ metadata read from cache"""
+        self.hits += n_
+        self._tick()
+
+    def done(self, n_=1):
+        """n_ DataObjects processed"""
+        self.processed += n_
+        self._tick()
+
+    def stats(self):
+        """return dictionary of current statistics"""
+        elapsed = max(time.monotonic() - self._start, 1e-9)
+        nodes = sum(self.levels.values())
+        return {
+            "phase": self.phase,
+            "done": self.processed,
+            "total": self.total,
+            "nodes": nodes,
+            "queries": self.queries,
+            "hits": self.hits,
+            "queue": self.queue,
+            "elapsed": round(elapsed, 1),
+            "rate": round(nodes / elapsed, 1),
+            "levels": {
+                level: {"nodes": n, "rate": round(n / elapsed, 1)}
+                for level, n in sorted(self.levels.items())
+            },
+        }
+
+    def _line(self, stats_):
+        """compact status line"""
+        total = f"/{stats_['total']}" if stats_["total"] is not None else ""
+        levels = " ".join(f"L{k}:{v['nodes']}" for k, v in stats_["levels"].items())
+        return (
+            f"{stats_['phase']}: {stats_['done']}{total} | "
+            f"{stats_['nodes']} nodes ({levels}) | "
+            f"{stats_['queries']} queries, {stats_['hits']} hits | "
+            f"queue {stats_['queue']} | {stats_['rate']} nodes/s"
+        )
+
+    def _log(self, stats_):
+        """structured log record"""
+        levels = " ".join(
+            f"L{k}={v['nodes']}@{v['rate']}/s" for k, v in stats_["levels"].items()
+        )
+        _logger.info(
+            f"progress phase={stats_['phase']} done={stats_['done']} total={stats_['total']} "
+            f"nodes={stats_['nodes']} queries={stats_['queries']} hits={stats_['hits']} "
+            f"queue={stats_['queue']} rate={stats_['rate']}/s elapsed={stats_['elapsed']}s "
+            f"levels=[{levels}]",
+            extra={"progress": stats_},
+        )
+
+    def _tick(self):
+        """render status line, or log record, if it is time to"""
+        if not self._enable or self.phase is None:
+            return
+        now = time.monotonic()
+        if self._tty:
+            if now - self._last >= _tty_interval:
+                self._last = now
+                line = self._line(self.stats())
+                self._stream.write("\r" + line.ljust(self._width))
+                self._stream.flush()
+                self._width = len(line)
+        elif now - self._last >= _log_interval:
+            self._last = now
+            self._log(self.stats())
+
+    def stop(self):
+        """end current phase, log summary"""
+        if self.phase is None:
+            return
+        if self._enable:
+            stats = self.stats()
+            if self._tty:
+                self._stream.write("\r" + self._line(stats).ljust(self._width) + "\n")
+                self._stream.flush()
+                self._width = 0
+            self._log(stats)
+        self.phase = None
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
+
+# See PyCharm help at https://www.jetbrains.com/help/pycharm/
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# session.py
+
+"""
+    This module set up a metadata session, shared by every entry point run in the same process.
+
+    A session holds the ICOS CP graph already crawled, the object type of each uri,
+    the properties of each uri, and a pooled HTTP session.
+    When icp2edd and checkOntology run one after the other (see wrapper.py),
+    the second one reuses what the first one read from ICOS CP.
+
+    Example usage:
+
+    import icp2edd.session as session
+
+    session.start()         # open metadata session
+    main()                  # run icp2edd
+    check()                 # run checkOntology, reuse metadata read by icp2edd
+    session.stop()          # close metadata session
+
+    _ = session.get()       # return current session, None if not started
+"""
+
+# --- import -----------------------------------
+# import from standard lib
+import logging
+
+# import from other lib
+import requests
+from requests.adapters import HTTPAdapter
+
+# import from my project
+
+# --- module's variable ------------------------
+# load logger
+_logger = logging.getLogger(__name__)
+
+# number of connections kept alive per host
+_pool_maxsize = 10
+
+# current session
+_current = None
+
+
+# ----------------------------------------------
+class MetaSession(object):
+    """ """
+
+    def __init__(self):
+        """initialise metadata session"""
+        # ICOS CP graph {uri: binding, ...} as ICPObj.meta
+        self.meta = {}
+        # object type of each uri {uri: objtype, ...}
+        self.types = {}
+        # properties of each uri {uri: {property, ...}, ...}
+        self.properties = {}
+        #
+        self._http = None
+        # number of connections kept alive per host
+        self._maxsize = _pool_maxsize
+
+    def _mount(self):
+        """mount adapter, with connection pool of self._maxsize, on HTTP session"""
+        adapter = HTTPAdapter(pool_connections=self._maxsize, pool_maxsize=self._maxsize)
+        for prefix in ("https://", "http://"):
+            if prefix in self._http.adapters:
+                self._http.adapters[prefix].close()
+            self._http.mount(prefix, adapter)
+
+    @property
+    def http(self):
+        """pooled HTTP session, opened on first use"""
+        if self._http is None:
+            self._http = requests.Session()
+            self._mount()
+        return self._http
+
+    def poolsize(self, size_):
+        """keep at least size_ connections alive per host (ex: number of download workers)"""
+        if size_ > self._maxsize:
+            self._maxsize = size_
+            if self._http is not None:
+                self._mount()
+
+    def close(self):
+        """ """
+        _logger.info(
+            f"metadata session: {len(self.meta)} object(s), {len(self.types)} type(s), "
+            f"{len(self.properties)} properties list(s)"
+        )
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+
+def start():
+    """open metadata session, shared until stop is called
+
+    :return: current session
+    """
+    global _current
+
+    if _current is None:
+        _current = MetaSession()
+    return _current
+
+
+def get():
+    """return current session, None if not started"""
+    return _current
+
+
+def stop():
+    """close current session"""
+    global _current
+
+    if _current is not None:
+        _current.close()
+        _current = None
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
+
+# See PyCharm help at https://www.jetbrains.com/help/pycharm/
@@ -7,6 +7,7 @@
 import argparse
 import atexit
 import datetime as dt
+import importlib.util
 import logging
 import logging.config
 import os
@@ -25,11 +26,19 @@ from dateutil.parser import parse
 
 # import from my project
 import icp2edd
+from icp2edd.csv4Erddap import list_engine, list_partition
 from icp2edd.icpobj import *
 
 # --- module's variable ------------------------
 # public
-global erddapPath, erddapWebInfDir, erddapContentDir, datasetXmlPath, datasetCsvPath, icp2eddPath, logPath, log_filename, submFrom, submUntil, product, lastversion, authorised_product, extraParam, downloadOnto, writeOnto, allowed_objects
+global erddapPath, erddapWebInfDir, erddapContentDir, datasetXmlPath, datasetCsvPath, icp2eddPath, logPath
+global log_filename, submFrom, submUntil, product, lastversion, authorised_product, extraParam
+global downloadOnto, writeOnto, allowed_objects
+global cacheEnable, cachePath, cacheTtl, cacheIncremental
+global streamBatch, streamHub, repackWorkers
+global downloadWorkers, downloadStore, downloadBuffer, downloadTransform
+global transformChunksize, transformPassthrough, transformEngine, transformWorkers, transformStats
+global transformPartition
 # private
 global _config, _cfg_path, _update_log, _logcfg, _warning_handler, _error_handler, _fatal_handler, _checkOnto
 
@@ -258,6 +267,208 @@ def _chk_config_onto(cfg_):
         # do not raise other exception as it will be by calling function
 
 
+def _chk_config_cache(cfg_):
+    """ """
+    global cacheEnable, cachePath, cacheTtl, cacheIncremental
+
+    # use persistent cache of ICOS CP entities
+    try:
+        cacheEnable = cfg_["cache"]["enable"].get(bool)
+    except confuse.exceptions.NotFoundError:
+        cacheEnable = False
+        # do not raise other exception as it will be by calling function
+
+    # path where store persistent cache
+    try:
+        _ = cfg_["cache"]["path"].get()
+    except confuse.exceptions.NotFoundError:
+        _ = None
+    if _ is not None:
+        cachePath = Path(str(_))
+    else:
+        cachePath = icp2eddPath / ".cache"
+    logging.debug(f"cachePath: {cachePath}")
+
+    # time to live (in days) of cached entities, per class
+    try:
+        cacheTtl = cfg_["cache"]["ttl"].get(dict)
+    except confuse.exceptions.NotFoundError:
+        cacheTtl = {}
+        # do not raise other exception as it will be by calling function
+
+    # only update attributes of datasets which changed since previous run
+    try:
+        cacheIncremental = cfg_["cache"]["incremental"].get(bool)
+    except confuse.exceptions.NotFoundError:
+        cacheIncremental = False
+        # do not raise other exception as it will be by calling function
+
+
+def _chk_config_stream(cfg_):
+    """ """
+    global streamBatch, streamHub
+
+    # number of DataObjects crawled, and repacked, at a time
+    try:
+        streamBatch = cfg_["stream"]["batch"].get()
+    except confuse.exceptions.NotFoundError:
+        streamBatch = None
+        # do not raise other exception as it will be by calling function
+    if streamBatch is not None:
+        streamBatch = int(streamBatch)
+        if streamBatch <= 0:
+            raise ValueError(
+                f"Invalid value, stream.batch -{streamBatch}- must be a positive integer"
+            )
+
+    # objects reached by at least 'hub' DataObjects are kept from one batch to another
+    try:
+        streamHub = cfg_["stream"]["hub"].get(int)
+    except confuse.exceptions.NotFoundError:
+        streamHub = 2
+        # do not raise other exception as it will be by calling function
+
+
+def _chk_config_repack(cfg_):
+    """ """
+    global repackWorkers
+
+    # number of processes used to repack DataObjects
+    try:
+        repackWorkers = cfg_["repack"]["workers"].get()
+    except confuse.exceptions.NotFoundError:
+        repackWorkers = None
+        # do not raise other exception as it will be by calling function
+    if repackWorkers is None:
+        repackWorkers = 1
+    else:
+        repackWorkers = int(repackWorkers)
+        if repackWorkers <= 0:
+            raise ValueError(
+                f"Invalid value, repack.workers -{repackWorkers}- must be a positive integer"
+            )
+
+
+def _chk_config_download(cfg_):
+    """ """
+    global downloadWorkers, downloadStore, downloadBuffer, downloadTransform
+
+    # number of files downloaded at the same time
+    try:
+        downloadWorkers = cfg_["download"]["workers"].get()
+    except confuse.exceptions.NotFoundError:
+        downloadWorkers = None
+        # do not raise other exception as it will be by calling function
+    if downloadWorkers is None:
+        downloadWorkers = 4
+    else:
+        downloadWorkers = int(downloadWorkers)
+        if downloadWorkers <= 0:
+            raise ValueError(
+                f"Invalid value, download.workers -{downloadWorkers}- must be a positive integer"
+            )
+
+    # path of content-addressed store of data files
+    try:
+        _ = cfg_["download"]["store"].get()
+    except confuse.exceptions.NotFoundError:
+        _ = None
+    if _ is not None:
+        downloadStore = Path(str(_))
+    else:
+        downloadStore = datasetCsvPath.parent / ".store"
+    logging.debug(f"downloadStore: {downloadStore}")
+
+    # size (in bytes) of buffer used to read, hash and write data files
+    try:
+        downloadBuffer = cfg_["download"]["buffer"].get()
+    except confuse.exceptions.NotFoundError:
+        downloadBuffer = None
+    if downloadBuffer is None:
+        downloadBuffer = 1048576
+    else:
+        downloadBuffer = int(downloadBuffer)
+        if downloadBuffer <= 0:
+            raise ValueError(
+                f"Invalid value, download.buffer -{downloadBuffer}- must be a positive integer"
+            )
+
+    # transform csv files while downloading
+    try:
+        downloadTransform = cfg_["download"]["transform"].get(bool)
+    except confuse.exceptions.NotFoundError:
+        downloadTransform = False
+
+
+def _chk_config_transform(cfg_):
+    """ """
+    global transformChunksize, transformPassthrough, transformEngine, transformWorkers
+    global transformStats, transformPartition
+
+    # number of rows of csv file changed at once
+    try:
+        transformChunksize = cfg_["transform"]["chunksize"].get()
+    except confuse.exceptions.NotFoundError:
+        transformChunksize = None
+        # do not raise other exception as it will be by calling function
+    if transformChunksize is not None:
+        transformChunksize = int(transformChunksize)
+        if transformChunksize <= 0:
+            raise ValueError(
+                f"Invalid value, transform.chunksize -{transformChunksize}- must be a positive integer"
+            )
+
+    # read csv values as raw strings, only change Date/Time values
+    try:
+        transformPassthrough = cfg_["transform"]["passthrough"].get(bool)
+    except confuse.exceptions.NotFoundError:
+        transformPassthrough = True
+
+    # engine used to read, and write csv file
+    try:
+        transformEngine = cfg_["transform"]["engine"].get()
+    except confuse.exceptions.NotFoundError:
+        transformEngine = None
+    if transformEngine is None:
+        transformEngine = "pandas"
+    if transformEngine not in list_engine:
+        raise ValueError(
+            f"Invalid value, transform.engine -{transformEngine}- must be in {list_engine}"
+        )
+    if transformEngine == "arrow" and importlib.util.find_spec("pyarrow") is None:
+        raise ImportError("transform.engine 'arrow' needs pyarrow, install it")
+
+    # number of csv files changed at the same time
+    try:
+        transformWorkers = cfg_["transform"]["workers"].get()
+    except confuse.exceptions.NotFoundError:
+        transformWorkers = None
+    if transformWorkers is None:
+        transformWorkers = 1
+    else:
+        transformWorkers = int(transformWorkers)
+        if transformWorkers <= 0:
+            raise ValueError(
+                f"Invalid value, transform.workers -{transformWorkers}- must be a positive integer"
+            )
+
+    # compute statistics of csv columns, and add them to global attributes
+    try:
+        transformStats = cfg_["transform"]["stats"].get(bool)
+    except confuse.exceptions.NotFoundError:
+        transformStats = False
+
+    # split csv files in time partitions
+    try:
+        transformPartition = cfg_["transform"]["partition"].get()
+    except confuse.exceptions.NotFoundError:
+        transformPartition = None
+    if transformPartition is not None and transformPartition not in list_partition:
+        raise ValueError(
+            f"Invalid value, transform.partition -{transformPartition}- must be in {list_partition}"
+        )
+
+
 def _chk_config_extra(cfg_):
     """ """
     global extraParam
@@ -390,6 +601,16 @@ def _chk_config(cfg_):
         _chk_config_authorised(cfg_)
         # check ontology parameters from configuration file(s)
         _chk_config_onto(cfg_)
+        # check cache parameters from configuration file(s)
+        _chk_config_cache(cfg_)
+        # check stream parameters from configuration file(s)
+        _chk_config_stream(cfg_)
+        # check repack parameters from configuration file(s)
+        _chk_config_repack(cfg_)
+        # check download parameters from configuration file(s)
+        _chk_config_download(cfg_)
+        # check transform parameters from configuration file(s)
+        _chk_config_transform(cfg_)
         # check update parameters from configuration file(s)
         _chk_config_extra(cfg_)
         # check product parameters from configuration file(s)
@@ -620,6 +841,37 @@ def _parse():
         parser.add_argument(
             "--type", type=str, help="data 'type' to be used", dest="product.type"
         )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            default=None,
+            help="only update ICOS CP attributes of datasets which changed since previous run",
+            dest="cache.incremental",
+        )
+        parser.add_argument(
+            "--batch",
+            type=int,
+            help="number of DataObjects crawled, and repacked, at a time [default: all at once]",
+            dest="stream.batch",
+        )
+        parser.add_argument(
+            "--repack-workers",
+            type=int,
+            help="number of processes used to repack DataObjects [default: 1]",
+            dest="repack.workers",
+        )
+        parser.add_argument(
+            "--download-workers",
+            type=int,
+            help="number of files downloaded at the same time [default: 4]",
+            dest="download.workers",
+        )
+        parser.add_argument(
+            "--transform-workers",
+            type=int,
+            help="number of processes used to change csv files [default: 1]",
+            dest="transform.workers",
+        )
     else:
         parser.add_argument(
             "--write_ontology",
@@ -654,7 +906,11 @@ def _parse():
     )
 
     # parse arguments
-    args = parser.parse_args()
+    if _checkOnto:
+        # ignore icp2edd arguments, when run after it (see wrapper.py)
+        args, _ = parser.parse_known_args()
+    else:
+        args = parser.parse_args()
 
     if _checkOnto and vars(args)["log.filename"] is None:
         # vars(args)['log.filename'] = logfile_
@@ -753,6 +1009,27 @@ def _show_arguments(cfg_, print_=False):
     logging.debug(f"paths.dataset.xml   : {datasetXmlPath}")
     logging.debug(f"paths.log           : {logPath}\n")
 
+    logging.debug(f"cache.enable        : {cacheEnable}")
+    logging.debug(f"cache.path          : {cachePath}")
+    logging.debug(f"cache.ttl           : {cacheTtl}")
+    logging.debug(f"cache.incremental   : {cacheIncremental}\n")
+
+    logging.debug(f"stream.batch        : {streamBatch}")
+    logging.debug(f"stream.hub          : {streamHub}\n")
+
+    logging.debug(f"repack.workers      : {repackWorkers}\n")
+
+    logging.debug(f"download.workers    : {downloadWorkers}")
+    logging.debug(f"download.store      : {downloadStore}")
+    logging.debug(f"download.buffer     : {downloadBuffer}")
+    logging.debug(f"download.transform  : {downloadTransform}\n")
+    logging.debug(f"transform.chunksize : {transformChunksize}")
+    logging.debug(f"transform.passthrough: {transformPassthrough}")
+    logging.debug(f"transform.engine    : {transformEngine}")
+    logging.debug(f"transform.workers   : {transformWorkers}")
+    logging.debug(f"transform.stats     : {transformStats}")
+    logging.debug(f"transform.partition : {transformPartition}\n")
+
     logging.debug(f"log.filename        : {log_filename} ")
     logging.debug(f"log.verbose         : {cfg_['log']['verbose']}  ")
     logging.debug(f"log.level           : {cfg_['log']['level']}\n")
@@ -785,6 +1062,27 @@ def _show_arguments(cfg_, print_=False):
         print(f"paths.dataset.xml   : {datasetXmlPath}")
         print(f"paths.log           : {logPath}\n")
 
+        print(f"cache.enable        : {cacheEnable}")
+        print(f"cache.path          : {cachePath}")
+        print(f"cache.ttl           : {cacheTtl}")
+        print(f"cache.incremental   : {cacheIncremental}\n")
+
+        print(f"stream.batch        : {streamBatch}")
+        print(f"stream.hub          : {streamHub}\n")
+
+        print(f"repack.workers      : {repackWorkers}\n")
+
+        print(f"download.workers    : {downloadWorkers}")
+        print(f"download.store      : {downloadStore}")
+        print(f"download.buffer     : {downloadBuffer}")
+        print(f"download.transform  : {downloadTransform}\n")
+        print(f"transform.chunksize : {transformChunksize}")
+        print(f"transform.passthrough: {transformPassthrough}")
+        print(f"transform.engine    : {transformEngine}")
+        print(f"transform.workers   : {transformWorkers}")
+        print(f"transform.stats     : {transformStats}")
+        print(f"transform.partition : {transformPartition}\n")
+
         print(f"log.filename        : {log_filename} ")
         print(f"log.verbose         : {cfg_['log']['verbose']}  ")
         print(f"log.level           : {cfg_['log']['level']}\n")
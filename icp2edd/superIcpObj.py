@@ -16,7 +16,9 @@
 
 # --- import -----------------------------------
 # import from standard lib
+import json
 import logging
+import multiprocessing as mp
 import traceback
 from pathlib import Path
 from pprint import pformat
@@ -27,8 +29,12 @@ from SPARQLWrapper.SmartWrapper import Value as SmartWrapperValue
 # > conda-forge
 # import from my project
 import icp2edd.parameters as parameters
+import icp2edd.session as session
 import icp2edd.setupcfg as setupcfg
 import icp2edd.util as util
+from icp2edd.crawlPolicy import CrawlPolicy
+from icp2edd.entityStore import EntityStore
+from icp2edd.progress import Progress
 from icp2edd.icpobj import *
 
 # --- module's variable ------------------------
@@ -38,8 +44,34 @@ _logger = logging.getLogger(__name__)
 list_VariableObject = ["cpmeta.DatasetVariable", "cpmeta.DatasetColumn"]
 list_DataObject = ["cpmeta.DataObject"]
 
-# list of object to not dig in to avoid infinity loop / recursive search
-list_rec_search = ["NextVersionOf", "RevisionOf", "PrimarySource", "QualityFlagFor"]
+# SuperICPObj shared with repack worker processes (fork copy-on-write)
+_shared = None
+
+
+def _repackWorker(uris_):
+    """
+    repack DataObjects uris_ in a worker process, from the SuperICPObj shared by fork.
+
+    :return: (DataObject, DataVariable, flattened attributes needed to store them, cycles found)
+    """
+    obj = _shared
+    # Note: persistent cache is not shared, every object type is already known
+    obj._store = None
+    obj.DataObject = {}
+    obj.DataVariable = {}
+    obj._policy.cycles = {}
+    # Note: progress is rendered by main process
+    obj._progress = Progress(enable_=False)
+    for uri in uris_:
+        obj.repack(uri)
+
+    keys = set(uris_)
+    for uri in uris_:
+        if uri in obj.meta:
+            keys.update(obj._reach(uri, exclude_=list_VariableObject)[1])
+    tmp = {uri: obj.tmp[uri] for uri in keys if uri in obj.tmp}
+    return obj.DataObject, obj.DataVariable, tmp, obj._policy.cycles
+
 
 # ----------------------------------------------
 class SuperICPObj(object):
@@ -67,12 +99,40 @@ class SuperICPObj(object):
         self.classprop = {}
         #
         self.tmp = {}
+        # uri already explored, with crawl rules, and depth {uri: {rules: depth, ...}, ...}
+        self._explored = {}
+        # object type of each uri
+        self._types = {}
+        # metadata session shared with other entry points (see session.py)
+        self._session = session.get()
+        if self._session is not None:
+            self._types = self._session.types
+        # renamed attribute names
+        self._renamed = {}
+        # progress telemetry
+        self._progress = Progress()
 
         # check parameters file
         param = parameters.main()
         #
         self.dict_convAttr = param["attributes"]["convert"]
         self.sep = param["attributes"]["sep"]
+        # crawl policy, to prune exploration of ICOS CP objects
+        self._policy = CrawlPolicy(param["crawl"])
+
+        # persistent cache of ICOS CP entities
+        self._store = None
+        if setupcfg.cacheEnable:
+            self._store = EntityStore(
+                setupcfg.cachePath / "entity.sqlite", setupcfg.cacheTtl
+            )
+            # metadata stored depend on crawl policy
+            self._store.resetOnChange(
+                "crawl", json.dumps(param["crawl"], sort_keys=True)
+            )
+            self._store.invalidateSubmitted(setupcfg.submFrom)
+        # only update attributes of DataObject which changed since previous run
+        self._incremental = setupcfg.cacheIncremental and self._store is not None
 
         try:
             if self._from is None:
@@ -83,11 +143,7 @@ class SuperICPObj(object):
                 # listuri = ["https://meta.icos-cp.eu/objects/-GpJLAEmZzHt48iB3l1eBuct"]
                 for uri in listuri:
                     _logger.info("get DataObject metadata from ICOS CP")
-                    _ = cpmeta.DataObject(uri=uri)
-                    _.getMeta()
-                    _.show()
-                    #
-                    self.meta = {**_.meta, **self.meta}
+                    self._loadMeta(cpmeta.DataObject, uri)
             else:
                 # list all datasets submitted since self._from
                 _logger.info(
@@ -96,8 +152,12 @@ class SuperICPObj(object):
                 # uri = "https://meta.icos-cp.eu/objects/uwXo3eDGipsYBv0ef6H2jJ3Z"
                 # _ = cpmeta.DataObject(uri=uri)
                 _ = cpmeta.DataObject(submfrom=self._from, product=self._product)
+                _._keep, _._prune = self._policy.query(_.objtype)
                 _.getMeta()
+                self._policy.countQuery(_.objtype, _.attr)
                 _.show()
+                if self._store is not None:
+                    self._store.put(_.objtype, _.meta)
                 #
                 self.meta = {**_.meta, **self.meta}
 
@@ -114,94 +174,470 @@ class SuperICPObj(object):
     def getAttr(self):
         """ """
         list_dataObj = list(self.meta.keys())
+        if self._incremental:
+            # reuse attributes of DataObjects unchanged since previous run
+            list_dataObj = self._reuseFlat(list_dataObj)
+
+        self._crawlRepack(list_dataObj)
+        self._policy.report(self.meta)
+
+        return {**self.DataObject, **self.DataVariable}
+
+    def iterAttr(self, batch_):
+        """
+        yield global attributes of DataObjects, batch_ DataObjects at a time,
+        then variable attributes of every DataObjects.
+
+        after each batch, objects reached by less than setupcfg.streamHub DataObjects
+        (and not pointed to by a shared one) are removed from memory.
+        They are read again (from cache if enabled) when reached by a later batch.
+
+        :param batch_: number of DataObjects crawled, and repacked, at a time
+        """
+        list_dataObj = list(self.meta.keys())
+        if self._incremental:
+            # reuse attributes of DataObjects unchanged since previous run
+            list_dataObj = self._reuseFlat(list_dataObj)
+            yield self.DataObject
+            self.DataObject = {}
+            # remove metadata read again to check them
+            self.meta = {uri: self.meta[uri] for uri in list_dataObj}
+
+        # number of DataObjects processed, which reach each object
+        refs = {}
+        for chunk in util.chunks(list_dataObj, batch_):
+            chunk = list(chunk)
+            self._crawlRepack(chunk)
+            yield self.DataObject
+            self.DataObject = {}
+            self._evict(chunk, refs)
+
+        self._policy.report(self.meta)
+
+        yield self.DataVariable
+
+    def _evict(self, uris_, refs_):
+        """
+        remove from memory objects reached by DataObjects uris_, which are not shared.
+
+        objects reached by at least setupcfg.streamHub DataObjects (hubs),
+        and objects they point to, are kept.
+
+        :param uris_: list of DataObject uri processed
+        :param refs_: number of DataObjects processed, which reach each object. updated in place
+        """
+        for uri in uris_:
+            deps, _ = self._reach(uri)
+            for dep in deps | {uri}:
+                refs_[dep] = refs_.get(dep, 0) + 1
+
+        kept = set()
+        stack = [uri for uri, n in refs_.items() if n >= setupcfg.streamHub]
+        while stack:
+            uri = stack.pop()
+            if uri in kept or uri not in self.meta:
+                continue
+            kept.add(uri)
+            for k, v in self._edges(uri):
+                if self._isLink(k, v):
+                    stack.append(v.value)
+
+        # Note: objects not reached yet (DataObjects of next batches) are kept
+        evicted = [uri for uri in self.meta if uri in refs_ and uri not in kept]
+        for uri in evicted:
+            del self.meta[uri]
+            self.tmp.pop(uri, None)
+            self._explored.pop(uri, None)
+        _logger.info(f"{len(evicted)} object(s) removed from memory, {len(kept)} kept")
+
+    def _crawlRepack(self, list_dataObj):
+        """crawl ICOS CP objects reached by DataObjects list_dataObj, and repack their attributes"""
         # fill self.meta
+        self._progress.start("crawl", len(list_dataObj))
         for uri in list_dataObj:
-            print(f"\nlook in uri: {uri} ", end="")
-            _logger.info(f"look in uri: {uri}")
+            _logger.debug(f"look in uri: {uri}")
             self._getSubAttr(uri)
-        print(f"")
+            self._progress.done()
+        self._progress.stop()
 
         # ll=['http://meta.icos-cp.eu/resources/cpmeta/temperature','http://meta.icos-cp.eu/resources/cpmeta/portion','http://meta.icos-cp.eu/resources/cpmeta/salinity']
         # self.repackMeta(self.meta.keys())
         # print(pformat(self.tmp))
 
         # repack with objtype
-        for uri in list_dataObj:
-            # get object type
-            print(f"\nspread in uri: {uri} ", end="")
-            self.repack(uri)
-        print(f"")
+        self._progress.start("repack", len(list_dataObj))
+        if setupcfg.repackWorkers > 1 and len(list_dataObj) > 1:
+            self._repackParallel(list_dataObj, setupcfg.repackWorkers)
+        else:
+            for uri in list_dataObj:
+                # get object type
+                _logger.debug(f"spread in uri: {uri}")
+                self.repack(uri)
+                self._progress.done()
+        self._progress.stop()
 
-        return {**self.DataObject, **self.DataVariable}
+        if self._store is not None:
+            self._storeFlat(list_dataObj)
 
-    def _renameKeyDic(self, _):
+    def _repackParallel(self, uris_, workers_):
         """
-        rename dictionary keys (if listed in dict_convAttr):
-        :return: renamed dictionary
+        repack DataObjects uris_ with workers_ processes.
+
+        metadata graph (self.meta) is shared read-only with worker processes through fork (copy-on-write).
+        results are merged in the order of uris_, as sequential repack would do.
+        """
+        global _shared
+
+        if "fork" not in mp.get_all_start_methods():
+            _logger.warning("fork not available, repack DataObjects sequentially")
+            for uri in uris_:
+                self.repack(uri)
+            return
+
+        # object type of every uri, so that workers do not ask ICOS CP
+        for uri in list(self.meta):
+            self._getObjType(uri)
+
+        chunksize = max(1, -(-len(uris_) // (workers_ * 4)))
+        chunks = [list(_) for _ in util.chunks(uris_, chunksize)]
+        _logger.info(
+            f"repack {len(uris_)} DataObject(s) with {workers_} processes, "
+            f"{len(chunks)} chunk(s)"
+        )
+
+        _shared = self
+        try:
+            with mp.get_context("fork").Pool(workers_) as pool:
+                # Note: imap keeps results in the order of chunks
+                results = []
+                for chunk, result in zip(chunks, pool.imap(_repackWorker, chunks)):
+                    results.append(result)
+                    self._progress.done(len(chunk))
+        finally:
+            _shared = None
+
+        for dataObject, dataVariable, tmp, cycles in results:
+            self.DataObject.update(dataObject)
+            self.DataVariable.update(dataVariable)
+            self.tmp.update(tmp)
+            for attr, loops in cycles.items():
+                self._policy.cycles.setdefault(attr, {}).update(loops)
+
+    def _reach(self, uri_, exclude_=()):
         """
-        for oldKey, newKey in self.dict_convAttr.items():
-            _ = dict((newKey, v) if k == oldKey else (k, v) for k, v in _.items())
-        return _
+        list uri which metadata are used to flatten uri_ (uri_ included)
 
-    def repack(self, uri_):
-        # TODO see if it could be merge with getSubAttr
-        _logger.debug(f"repack uri {uri_}")
+        objects of type listed in exclude_ are not explored, but returned apart
+
+        :return: (set of uri used, set of uri excluded)
+        """
+        deps = set()
+        excluded = set()
+        stack = [uri_]
+        while stack:
+            uri = stack.pop()
+            if uri in deps or uri not in self.meta:
+                continue
+            deps.add(uri)
+            for k, v in self._edges(uri):
+                if self._isLink(k, v) and v.value in self.meta:
+                    if self._getObjType(v.value) in exclude_:
+                        excluded.add(v.value)
+                    else:
+                        stack.append(v.value)
+
+        # Note: object of unknown type are not stored
+        deps = {uri for uri in deps if self._getObjType(uri) is not None}
+        return deps, excluded
+
+    def _storeFlat(self, uris_):
+        """store flattened attributes of DataObjects uris_, and of their variables, for next run"""
+        names = {}
+        for uri in uris_:
+            if self._getObjType(uri) not in list_DataObject:
+                continue
+            deps, refs = self._reach(uri, exclude_=list_VariableObject)
+            filename = self.meta[uri]["filename"][0].value
+            names[filename] = uri
+            datasetId = util.datasetidCase(Path(filename))
+            self._store.putFlat(
+                uri, "DataObject", datasetId, self.tmp[uri], deps, refs
+            )
+            for ref in refs:
+                if ref not in self.tmp:
+                    continue
+                deps, _ = self._reach(ref)
+                varname = util.filterBracket(self.meta[ref]["column_title"][0].value)
+                self._store.putFlat(ref, "DataVariable", varname, self.tmp[ref], deps, [])
+
+        self._store.putDataset(names)
+
+    def _reuseFlat(self, uris_):
+        """
+        fill self.DataObject and self.DataVariable with flattened attributes stored during previous run,
+        for DataObjects which none of the metadata used changed since then.
+
+        expired metadata are read again from ICOS CP, to check whether they changed.
+
+        :return: list of DataObject uri to be updated
+        """
+        records = {}
+        for uri in uris_:
+            flat = self._store.getFlat(uri)
+            if flat is None:
+                continue
+            refs = [self._store.getFlat(ref) for ref in flat["refs"]]
+            if None not in refs:
+                records[uri] = [flat, *refs]
+
+        # read again expired metadata
+        deps = {d for rec in records.values() for flat in rec for d in flat["deps"]}
+        self._refresh([d for d in deps if not self._store.isFresh(d)])
+
+        dirty = []
+        for uri in uris_:
+            rec = records.get(uri)
+            if rec is None or any(
+                d in self._store.changed or not self._store.isFresh(d)
+                for flat in rec
+                for d in flat["deps"]
+            ):
+                dirty.append(uri)
+            else:
+                flat, *refs = rec
+                self.DataObject[flat["id"]] = flat["attrs"]
+                for ref in refs:
+                    self.DataVariable[ref["id"]] = ref["attrs"]
+
+        _logger.info(
+            f"{len(uris_) - len(dirty)} DataObject(s) unchanged since previous run, "
+            f"{len(dirty)} to be updated"
+        )
+        return dirty
+
+    def _refresh(self, uris_):
+        """read again metadata of uris_ from ICOS CP"""
+        bytype = {}
+        for uri in uris_:
+            bytype.setdefault(self._getObjType(uri), []).append(uri)
+        for objtype, uris in bytype.items():
+            if objtype is None:
+                continue
+            klass = type(globals()[objtype]())
+            for chunk in util.chunks(uris, 10):
+                self._loadMeta(klass, list(chunk))
+
+    def _renameKey(self, key_):
+        """
+        rename key (if listed in dict_convAttr).
+        result is cached, as the same keys are renamed for every object.
+        :return: renamed key
+        """
+        if key_ not in self._renamed:
+            _ = key_
+            for oldKey, newKey in self.dict_convAttr.items():
+                if _ == oldKey:
+                    _ = newKey
+            self._renamed[key_] = _
+        return self._renamed[key_]
+
+    def _getObjType(self, uri_):
+        """return object type of uri_, ICOS CP is asked only once per uri"""
+        if uri_ not in self._types:
+            try:
+                if self._store is None:
+                    raise KeyError(uri_)
+                self._types[uri_] = self._store.getType(uri_)
+                self._progress.hit()
+            except KeyError:
+                self._types[uri_] = ICPObj(uri=uri_).objtype
+                self._progress.query()
+                if self._store is not None:
+                    self._store.putType({uri_: self._types[uri_]})
+        return self._types[uri_]
+
+    def _loadMeta(self, klass_, uri_):
+        """
+        load metadata of uri_ (an uri, or a list of uri) of class klass_ into self.meta
+
+        metadata are read from the persistent cache, if there and not expired,
+        otherwise from ICOS CP (and then stored in cache).
+        metadata already in self.meta are kept.
+        """
+        uris = uri_ if isinstance(uri_, list) else [uri_]
+
+        missing = []
+        for uri in uris:
+            if self._session is not None and uri in self._session.meta:
+                _logger.debug(f"read metadata of {uri} from session")
+                self._progress.hit()
+                self.meta.setdefault(uri, self._session.meta[uri])
+                continue
+            binding = self._store.get(uri) if self._store is not None else None
+            if binding is not None:
+                _logger.debug(f"read metadata of {uri} from cache")
+                self._progress.hit()
+                self.meta.setdefault(uri, binding)
+            else:
+                missing.append(uri)
+
+        if missing:
+            _ = klass_(uri=missing if isinstance(uri_, list) else uri_)
+            # properties (not) to be requested
+            _._keep, _._prune = self._policy.query(_.objtype)
+            _.getMeta()
+            self._progress.query()
+            self._policy.countQuery(_.objtype, _.attr)
+            _.show()
+            if self._store is not None:
+                self._store.put(_.objtype, _.meta)
+            #
+            for uri, binding in _.meta.items():
+                self.meta.setdefault(uri, binding)
+
+        if self._session is not None and setupcfg.streamBatch is None:
+            # Note: in stream mode, metadata are not kept in session, to bound memory
+            for uri in uris:
+                if uri in self.meta:
+                    self._session.meta.setdefault(uri, self.meta[uri])
+
+    def close(self):
+        """close persistent cache"""
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+
+    def _edges(self, uri_):
+        """
+        yield (attribute, value) of uri_ to be spread
+
+        special cases for keys 'uri' and attributes ignored by crawl policy:
+        - 'uri': ignored
+        - 'ignore' mode (list_rec_search by default): ignored, to avoid recursive search
+        """
+        for k, lv in self.meta[uri_].items():
+            if k in ["uri"]:
+                _logger.debug(f"ignore uri attribute")
+            elif self._policy.predicate(k) == "ignore":
+                _logger.debug(
+                    f"ignore {k} attribute. do not iterate to avoid recursive search"
+                )
+            else:
+                for v in lv:
+                    if not isinstance(v, SmartWrapperValue):
+                        raise TypeError(
+                            "invalid type: element -{v}- must be of type SmartWrapperValue"
+                        )
+                    yield k, v
+
+    def _isLink(self, k_, v_):
+        """check if value v_ of attribute k_ points to an object to be explored and spread"""
+        return v_.type == "uri" and self._policy.predicate(k_) == "follow"
+
+    def _compose(self, uri_, exclude_, excluded_):
+        """
+        compose flattened attributes of uri_, from its own literals and
+        from the flattened attributes (already in self.tmp) of the objects it points to.
+
+        objects of type listed in exclude_ are not composed, but append to excluded_
 
-        def spread(uri_, exclude_=[], cnt_=0):
+        :return: flattened dictionary {attribute: [value, ...], ...}
+        """
+        pairs = []
+        for k, v in self._edges(uri_):
+            if not self._isLink(k, v):
+                pairs.append((self._renameKey(k), [v.value]))
+            elif v.value not in self.meta:
+                _logger.debug(f"ignore {k} attribute. -{v.value}- not explored")
+            elif self._getObjType(v.value) in exclude_:
+                excluded_.append(v.value)
+            elif v.value in self.tmp:
+                # separator between object and attribute
+                prefix = k + self.sep
+                pairs.extend(
+                    (self._renameKey(prefix + kk), vv)
+                    for kk, vv in self.tmp[v.value].items()
+                )
+            else:
+                _logger.debug(
+                    f"ignore {k} attribute. -{v.value}- is currently spread, "
+                    f"do not iterate to avoid recursive search"
+                )
+
+        # Note: last values first, as util.combine_dict_in_list(new, old) does
+        flat = {}
+        for key, values in reversed(pairs):
+            flat.setdefault(key, []).extend(values)
+
+        return flat
+
+    def _flatten(self, uri_, exclude_=()):
+        """
+        flatten attributes of uri_, and of every object it points to.
+
+        iterative post-order traversal (not bounded by the recursion limit):
+        each object is flattened once, and stored in self.tmp.
+        Then its parents only prefix the keys of this flattened dictionary.
+        link back to an object in progress closes a cycle: it is reported, and not spread.
 
-            cnt_ += 1
-            print("." * cnt_, end="", flush=True)
+        objects of type listed in exclude_ are not flattened in, but repacked on their own.
 
-            self.tmp[uri_] = {}
-            if uri_ not in self.meta.keys():
-                _logger.critical(f"Try spreading unknown uri -{uri_}-")
+        :return: flattened dictionary {attribute: [value, ...], ...}
+        """
+        excluded = []
+        # Note: objects in progress are the path from uri_ to the current object
+        inprogress = {}
+        stack = [uri_]
+        while stack:
+            uri = stack[-1]
+            if uri in self.tmp:
+                # already flattened
+                stack.pop()
+                continue
+
+            if uri not in self.meta:
+                # Note: objects not explored (see crawl policy) are not pushed
+                _logger.critical(f"Try spreading unknown uri -{uri}-")
                 raise SystemExit(1)
 
-            for k, lv in self.meta[uri_].items():
-                if k in ["uri"]:
-                    _logger.debug(f"ignore uri attribute")
-                    # if k not in self.tmp[uri_].keys():
-                    #     d = {k: str(lv[0].value)}
-                    #     self.tmp[uri_] = util.combine_dict_in_list(d, self.tmp[uri_])
-                elif k in list_rec_search:
-                    _logger.debug(
-                        f"ignore {k} attribute. do not iterate to avoid recursive search"
-                    )
-                else:
-                    for v in lv:
-                        if not isinstance(v, SmartWrapperValue):
-                            raise TypeError(
-                                "invalid type: element -{v}- must be of type SmartWrapperValue"
-                            )
-
-                        d = {}
-                        if v.type != "uri":
-                            d[k] = [v.value]
-                        else:
-                            objtype = ICPObj(uri=v.value).objtype
-                            if objtype not in exclude_:
-                                if v.value in self.tmp.keys():
-                                    for kk, vv in self.tmp[v.value].items():
-                                        # separator between object and attribute
-                                        kkk = k + self.sep + kk
-                                        d[kkk] = vv
-                                else:
-                                    dd = spread(v.value, exclude_=exclude_, cnt_=cnt_)
-                                    for kk, vv in dd.items():
-                                        # separator between object and attribute
-                                        kkk = k + self.sep + kk
-                                        d[kkk] = vv
-                            else:
-                                self.repack(v.value)
-
-                        d = self._renameKeyDic(d)
-                        self.tmp[uri_] = util.combine_dict_in_list(d, self.tmp[uri_])
-
-            return self.tmp[uri_]
+            if uri not in inprogress:
+                # pre-order: first look at objects not flattened yet
+                inprogress[uri] = None
+                self._progress.visit(len(inprogress), len(stack))
+                children = []
+                for k, v in self._edges(uri):
+                    if (
+                        not self._isLink(k, v)
+                        or v.value not in self.meta
+                        or v.value in self.tmp
+                        or self._getObjType(v.value) in exclude_
+                    ):
+                        continue
+                    if v.value in inprogress:
+                        path = list(inprogress)
+                        start = path.index(v.value)
+                        self._policy.cycle(path[start:] + [v.value], k)
+                    else:
+                        children.append(v.value)
+                # Note: flatten objects in the order they are listed, as _getSubAttr does
+                stack.extend(reversed(children))
+            else:
+                # post-order: every object pointed to is flattened
+                stack.pop()
+                del inprogress[uri]
+                self.tmp[uri] = self._compose(uri, exclude_, excluded)
+
+        for uri in dict.fromkeys(excluded):
+            self.repack(uri)
+
+        return self.tmp[uri_]
+
+    def repack(self, uri_):
+        # TODO see if it could be merge with getSubAttr
+        _logger.debug(f"repack uri {uri_}")
 
         # check object type
-        _ = ICPObj(uri=uri_)
-        objtype = _.objtype
+        objtype = self._getObjType(uri_)
 
         if objtype in list_DataObject:
             # Warning: linked to:
@@ -215,7 +651,9 @@ class SuperICPObj(object):
             # datasetId = case.camel('icos_' + filename.stem, sep='_')
             datasetId = util.datasetidCase(filename)
 
-            self.DataObject[datasetId] = spread(uri_, exclude_=list_VariableObject)
+            self.DataObject[datasetId] = self._flatten(
+                uri_, exclude_=list_VariableObject
+            )
 
         elif objtype in list_VariableObject:
             # Warning: linked to:
@@ -229,7 +667,7 @@ class SuperICPObj(object):
             # variableId = case.camel(varname, sep='_')
             variableId = util.filterBracket(varname)
 
-            self.DataVariable[variableId] = spread(uri_)
+            self.DataVariable[variableId] = self._flatten(uri_)
 
         else:
             _logger.error(f"should not be run objtype {objtype}")
@@ -237,71 +675,100 @@ class SuperICPObj(object):
         # clean
         # self.tmp = {}
 
-    def _getSubAttr(self, uri_, cnt_=0):
+    def _getSubAttr(self, uri_, cnt_=0, rules_=()):
         """
-        dict1 = {name: value, name: value, ...}
+        explore every object uri_ points to, and load their metadata into self.meta
 
-        special cases for keys 'uri' and 'NextVersionOf'.
+        iterative depth-first traversal (not bounded by the recursion limit):
+        each object is explored once per crawl rules inherited, and again only if reached
+        at a lower depth (see _isExplored), so that attributes do not depend on the order of paths.
+        link back to an object on the current path closes a cycle: it is reported, and not followed.
+
+        special cases for keys 'uri' and attributes not followed by crawl policy.
         - 'uri': do not iterate to avoid infinity loop
-        - 'NextVersionOf' : do not iterate to avoid recursive search inside previous versions
-        """
-        cnt_ += 1
-        print("." * cnt_, end="", flush=True)
+        - 'ignore' or 'uri' mode (ex: 'NextVersionOf') : do not iterate to avoid recursive search
 
-        for k, lv in self.meta[uri_].items():
-            if k == "uri":
-                # do nothing, you are currently exploring it
-                _logger.debug(f"do nothing, you are currently exploring this uri -{k}-")
-            elif k in list_rec_search:
-                # Warning: linked to:
-                # - 'cpmeta:isNextVersionOf'  in StaticObject, and Collection
-                # - 'cpmeta:isQualityFlagFor' in DatasetColumn
-                # - 'prov:hadPrimarySource'   in StaticObject, and Collection
-                # - 'prov:wasRevisionOf'      in StaticObject, and Collection
-                _logger.debug(
-                    f"key {k} found. do not iterate to avoid recursive search"
+        objects pruned by crawl policy are not explored.
+        rules_ are the crawl rules inherited from the path used to reach uri_
+        """
+        # current path, from uri_ to the object explored
+        path = []
+        # object to explore (uri, depth, crawl rules, attribute pointing to it)
+        # Note: None marks the end of exploration of the last object of the path
+        stack = [(uri_, cnt_, rules_, None)]
+        while stack:
+            uri, cnt, rules, attr = stack.pop()
+            if uri is None:
+                path.pop()
+                continue
+
+            if uri in path:
+                start = path.index(uri)
+                self._policy.cycle(path[start:] + [uri], attr)
+                _logger.debug(f"key {attr} closes a cycle. do not explore {uri}")
+                continue
+            if self._isExplored(uri, cnt, rules):
+                _logger.debug(f"do nothing, uri -{uri}- already explored")
+                continue
+
+            if uri not in self.meta:
+                # check object type
+                objtype = self._getObjType(uri)
+
+                # dummy patch cause issue on instrument data
+                # https://meta.icos-cp.eu/objects/Rd3xqDBV1PhqO-7Y9GGIRw0q
+                if objtype is None:
+                    self.meta[uri] = {}
+                    self._explored.setdefault(uri, {})[rules] = cnt
+                    continue
+
+                try:
+                    klass = type(globals()[objtype]())
+                except Exception:
+                    _logger.exception(f"can not found class {objtype}, for object {uri}")
+                    raise
+                try:
+                    self._loadMeta(klass, uri)
+                except Exception:
+                    _logger.exception(f"can not found metadata from {objtype}[{uri}]")
+                    raise
+                _logger.debug(f"dig into to explore {objtype} uri: {uri}")
+
+            self._explored.setdefault(uri, {})[rules] = cnt
+            cnt += 1
+            self._progress.visit(cnt, len(stack))
+
+            path.append(uri)
+            stack.append((None, None, None, None))
+            children = []
+            for k, v in self._edges(uri):
+                if not self._isLink(k, v):
+                    continue
+                child = v.value
+                follow, childrules = self._policy.follow(
+                    self._getObjType(uri), k, rules, child
                 )
-            else:
-                for v in lv:
-                    if not isinstance(v, SmartWrapperValue):
-                        raise TypeError(
-                            "invalid type: element -{v}- must be of type SmartWrapperValue"
-                        )
+                if child not in path and self._isExplored(child, cnt, childrules):
+                    _logger.debug(f"do nothing, uri -{child}- already explored")
+                    continue
+                if not follow or self._policy.tooDeep(cnt, child):
+                    _logger.debug(
+                        f"key {k} pruned by crawl policy. do not explore {child}"
+                    )
+                    continue
+                children.append((child, cnt, childrules, k))
+            # Note: explore objects in the order they are listed
+            stack.extend(reversed(children))
 
-                    if v.type == "uri":
-                        uri = v.value
-                        if uri in self.meta:
-                            _logger.debug(f"do nothing, uri -{uri}- already in meta")
-                        else:
-                            # check object type
-                            _ = ICPObj(uri=uri)
-                            objtype = _.objtype
+    def _isExplored(self, uri_, cnt_, rules_):
+        """check if uri_ is already explored with crawl rules rules_, at depth cnt_ or lower
 
-                            # dummy patch cause issue on instrument data
-                            # https://meta.icos-cp.eu/objects/Rd3xqDBV1PhqO-7Y9GGIRw0q
-                            if objtype is not None:
-                                try:
-                                    klass = type(globals()[objtype]())
-                                    _ = klass(uri=uri)
-                                    try:
-                                        _.getMeta()
-                                        self.meta = {**_.meta, **self.meta}
-                                        _logger.debug(
-                                            f"dig into to explore {objtype} uri: {uri}"
-                                        )
-                                        self._getSubAttr(uri, cnt_)
-                                    except Exception:
-                                        _logger.exception(
-                                            f"can not found metadata from {objtype}[{uri}]"
-                                        )
-                                        raise
-                                except Exception:
-                                    _logger.exception(
-                                        f"can not found class {objtype}, for object {uri}"
-                                    )
-                                    raise
-                            else:
-                                self.meta[uri] = {}
+        Note: depth does not matter, if crawl depth is not limited
+        """
+        depth = self._explored.get(uri_, {}).get(rules_)
+        if depth is None:
+            return False
+        return self._policy.depth is None or depth <= cnt_
 
     def _listDatasetLoaded(self):
         """ """
@@ -312,6 +779,14 @@ class SuperICPObj(object):
 
         # list URI related to those directory name(s)
         uri_list = []
+        if self._incremental:
+            # URI already known from previous run
+            known = {name: self._store.getDataset(name) for name in output}
+            known = {k: v for k, v in known.items() if v is not None}
+            for chunk in util.chunks(sorted(known.values()), 10):
+                uri_list.append(list(chunk))
+            output = output - set(known)
+
         for chunk in util.chunks(list(output), 10):
             _ = cpmeta.DataObject()
             uri_list.append(_.listUri(list(chunk)))
@@ -351,25 +826,46 @@ class SuperICPObj(object):
 
     def getClassProperties(self):
         """ """
-        list_dataObj = self.meta.keys()
+        list_dataObj = list(self.meta.keys())
         # fill self.meta
+        self._progress.start("crawl", len(list_dataObj))
         for uri in list_dataObj:
-            print(f"\nlook in uri: {uri} ", end="")
-            _logger.info(f"look in uri: {uri}")
+            _logger.debug(f"look in uri: {uri}")
             self._getSubAttr(uri)
-        print(f"")
+            self._progress.done()
+        self._progress.stop()
+        self._policy.report(self.meta)
 
         # get properties for each class object
-        for uri in self.meta.keys():
-            print(f"\nlook for properties in uri: {uri} ", end="")
-            _logger.info(f"look for properties in uri: {uri}")
-            _ = ICPObj(uri=uri)
-            objtype = _.objtype.replace(".", ":")
-            if objtype not in self.classprop:
-                self.classprop[objtype] = set()
-            list_props = _.getProperties()
-            # add properties if not already listed
-            self.classprop[objtype] = {*list_props, *self.classprop[objtype]}
+        # Note: object of unknown type have no class
+        list_uri = [uri for uri in self.meta if self._getObjType(uri) is not None]
+        self._progress.start("properties", len(list_uri))
+        # to avoid too large Request-URI, loop over chunk of uri
+        for chunk in util.chunks(list_uri, 10):
+            props = self._getProperties(list(chunk))
+            for uri, list_props in props.items():
+                _logger.debug(f"look for properties in uri: {uri}")
+                objtype = self._getObjType(uri).replace(".", ":")
+                if objtype not in self.classprop:
+                    self.classprop[objtype] = set()
+                # add properties if not already listed
+                self.classprop[objtype] = {*list_props, *self.classprop[objtype]}
+            self._progress.done(len(chunk))
+        self._progress.stop()
+
+    def _getProperties(self, uris_):
+        """return properties of each uri of uris_, ICOS CP is asked only once per uri
+
+        :return: dictionary {uri: {property, ...}, ...}
+        """
+        cache = self._session.properties if self._session is not None else {}
+        missing = [uri for uri in uris_ if uri not in cache]
+        if missing:
+            cache.update(ICPObj().listProperties(missing))
+            self._progress.query()
+        else:
+            self._progress.hit(len(uris_))
+        return {uri: cache[uri] for uri in uris_}
 
     def _getSubProp(self, uri_, cnt_=0):
         """
@@ -380,18 +876,14 @@ class SuperICPObj(object):
         - 'NextVersionOf' : do not iterate to avoid recursive search inside previous versions
         """
         cnt_ += 1
-        print("." * cnt_, end="", flush=True)
+        self._progress.visit(cnt_)
 
         for k, lv in self.meta[uri_].items():
             if k == "uri":
                 # do nothing, you are currently exploring it
                 _logger.debug(f"do nothing, you are currently exploring this uri -{k}-")
-            elif k in list_rec_search:
-                # Warning: linked to:
-                # - 'cpmeta:isNextVersionOf' in StaticObject, and Collection
-                # - 'cpmeta:isQualityFlagFor' in DatasetColumn
-                # - 'prov:hadPrimarySource'  in StaticObject, and Collection
-                # - 'prov:wasRevisionOf'     in StaticObject, and Collection
+            elif self._policy.predicate(k) != "follow":
+                # Warning: linked to list_rec_search in crawlPolicy
                 _logger.debug(
                     f"key {k} found. do not iterate to avoid recursive search"
                 )
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# supersession.py
+
+"""
+    This module set up a manager of dataset versions.
+
+    When a new version of a DataObject is published on ICOS CP (cpmeta:isNextVersionOf),
+    with the same filename, it is downloaded in the same directory, and keeps the same ERDDAP datasetID.
+    Otherwise, the directory of the previous version, and its dataset.xml fragment, are retired,
+    so that datasets.xml only serves the last version of each dataset.
+
+    Example usage:
+
+    from supersession import Supersession
+
+    sup = Supersession()
+    sup.map(uris)           # map previous versions of DataObjects uris on their last version
+    sup.retire(filenames)   # remove directories of previous versions, not in filenames
+"""
+
+# --- import -----------------------------------
+# import from standard lib
+import logging
+import re
+import shutil
+from pathlib import Path
+
+# import from other lib
+# import from my project
+import icp2edd.setupcfg as setupcfg
+import icp2edd.util as util
+from icp2edd.icpobj import cpmeta
+
+# --- module's variable ------------------------
+# load logger
+_logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------
+def _stem(filename_):
+    """return dataset directory name of filename_
+
+    Warning: linked to dataObject.py, white space(s) replaced by underscore
+    """
+    return Path(re.sub(r"\s+", "_", filename_)).stem
+
+
+class Supersession(object):
+    """ """
+
+    def __init__(self):
+        """initialise version manager"""
+        # last version of each previous version {previous uri: uri, ...}
+        self.next = {}
+        # dataset directory name of each previous version {previous uri: stem, ...}
+        self.stems = {}
+
+    def map(self, uris_):
+        """map previous versions of DataObjects uris_ on their last version
+
+        :param uris_: list of DataObjects uri (last version)
+        """
+        _ = cpmeta.DataObject()
+        for chunk in util.chunks(list(uris_), 10):
+            for prev, (uri, name) in _.listPreviousVersion(chunk).items():
+                self.next[prev] = uri
+                self.stems[prev] = _stem(name)
+        _logger.debug(f"previous versions: {self.next}")
+
+    def retire(self, filenames_):
+        """remove csv directory, and dataset.xml fragment, of previous versions
+
+        directories of datasets in filenames_ are kept, as they are reused by their last version.
+
+        :param filenames_: filenames of the last versions
+        :return: list of dataset directory name retired
+        """
+        keep = {_stem(str(f)) for f in filenames_}
+        retired = []
+        for prev, stem in sorted(self.stems.items(), key=lambda x: x[1]):
+            if not stem or stem in keep or stem in retired:
+                continue
+            dirs = [
+                d
+                for d in dict.fromkeys(
+                    (setupcfg.datasetCsvPath / stem, setupcfg.datasetXmlPath / stem)
+                )
+                if d.is_dir()
+            ]
+            if not dirs:
+                continue
+            _logger.info(
+                f"dataset {util.datasetidCase(stem)} superseded by {self.next[prev]}, "
+                f"retire {', '.join(str(d) for d in dirs)}"
+            )
+            for d in dirs:
+                shutil.rmtree(d)
+            retired.append(stem)
+
+        return retired
+
+
+if __name__ == "__main__":
+    import doctest
+
+    doctest.testmod(optionflags=doctest.ELLIPSIS | doctest.NORMALIZE_WHITESPACE)
+
+# See PyCharm help at https://www.jetbrains.com/help/pycharm/
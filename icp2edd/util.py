@@ -133,6 +133,11 @@ def datasetidCase(filename_):
     return camelCase("icos_" + filename_.stem, sep="_")
 
 
+def classKey(klass_):
+    """return object type name of class, as in icpobj globals ('cpmeta.Station')"""
+    return f"{klass_.__module__.split('.')[-2]}.{klass_.__name__}"
+
+
 def filterBracket(name_):
     """ """
     return re.sub(r"(.*)(\[.*\])(.*)", r"\1" r"\3", name_).strip()
@@ -19,6 +19,7 @@ import shutil
 import lxml.etree as etree
 
 # import from my project
+import icp2edd.csv4Erddap as c4edd
 import icp2edd.parameters as parameters
 import icp2edd.setupcfg as setupcfg
 import icp2edd.util as util
@@ -94,7 +95,8 @@ class Xml4Erddap(object):
             # Starting directory (default="")
             self._cmd.append(dirout_)
             # File name regex (e.g., ".*\.asc") (default="")
-            self._cmd.append(r".*\.csv")
+            # Note: only time partitions, if any (see csv4Erddap.partition)
+            self._cmd.append(c4edd.fileRegex(setupcfg.transformPartition))
             # Full file name of one file (or leave empty to use first matching fileName) (default="")
             self._cmd.append("nothing")
             # Charset (e.g., ISO-8859-1 (default) or UTF-8) (default="")
@@ -115,10 +117,14 @@ class Xml4Erddap(object):
             self._cmd.append("default")
             # Column name for extract (default="")
             self._cmd.append("default")
+            # Note: rows are sorted by Date/Time (see csv4Erddap.sort)
+            sortedColumn = c4edd.timeColumn(sorted(dirout_.glob("*.csv"))[0])
+            if sortedColumn is None:
+                sortedColumn = "default"
             # Sorted column source name (default="")
-            self._cmd.append("default")
+            self._cmd.append(sortedColumn)
             # Sort files by sourceNames (default="")
-            self._cmd.append("default")
+            self._cmd.append(sortedColumn)
             # infoUrl (default="")
             self._cmd.append("https://www.icos-cp.eu/")
             # institution (default="")
@@ -273,6 +279,14 @@ class Xml4Erddap(object):
         return re.search(tagline, content)
 
 
+def remove(stem_):
+    """remove dataset.xml fragment of dataset directory stem_, so that it is not concatenated"""
+    datasetSubDir = setupcfg.datasetXmlPath / stem_
+    for ff in datasetSubDir.glob(f"dataset.{stem_}.xml*"):
+        _logger.info(f"remove dataset: {ff}")
+        ff.unlink()
+
+
 def concatenate():
     """concatenate header.xml users.xml dataset.XXX.xml footer.xml into local datasets.xml
 
@@ -306,20 +320,117 @@ def concatenate():
     return dsxmlout
 
 
+def publish(stem_):
+    """update ERDDAP datasets.xml with dataset.xml fragment of dataset directory stem_
+
+    dataset node with the same datasetID is replaced (removed if fragment was removed, see remove),
+    or added after the last dataset, so that a dataset is served as soon as generated,
+    while the others are still processed.
+    ERDDAP datasets.xml is written apart, then renamed, so that ERDDAP never reads it partially.
+
+    Note: ICOS CP metadata are added once every dataset is done (see changeAttr)
+    """
+    dsxml = setupcfg.erddapContentDir / "datasets.xml"
+    if not dsxml.is_file():
+        replaceXmlBy(concatenate())
+        return
+
+    ds = setupcfg.datasetXmlPath / stem_ / f"dataset.{stem_}.xml"
+    dsID = util.datasetidCase(stem_)
+    _logger.info(f"publish dataset: {dsID}")
+
+    # keep CDATA as it is
+    parser = etree.XMLParser(strip_cdata=False, encoding="ISO-8859-1")
+
+    tree = etree.parse(str(dsxml), parser)
+    root = tree.getroot()
+
+    nodes = []
+    if ds.is_file():
+        # Note: fragment is not well-formed on its own, see concatenate
+        fragment = etree.fromstring(
+            b"<erddapDatasets>" + ds.read_bytes() + b"</erddapDatasets>", parser
+        )
+        nodes = fragment.findall("dataset")
+
+    previous = root.findall("dataset")
+    last = previous[-1] if previous else None
+    for node in previous:
+        if node.get("datasetID") == dsID:
+            if node is last:
+                last = node.getprevious()
+            root.remove(node)
+    for node in nodes:
+        if last is not None:
+            last.addnext(node)
+        else:
+            root.append(node)
+        last = node
+
+    tmp = dsxml.parent / (dsxml.name + ".tmp")
+    tree.write(str(tmp), encoding="ISO-8859-1", xml_declaration=True)
+    os.replace(tmp, dsxml)
+
+
+def _changeAttrNode(attrNode, att_, param_, sort_=False):
+    """
+    change/add attributes att_ into node 'addAttributes'
+
+    Warning: att_ is modified in place, see 'keep' in parameters file
+
+    :param attrNode: node 'addAttributes'
+    :param att_: dictionary of attributes {attname: [value, ...], ...}
+    :param param_: parameters
+    :param sort_: add attributes in alphabetical order
+    """
+    _logger.debug(f"attrNode: tag -{attrNode.tag}- attribute -{attrNode.attrib}-")
+    for att in attrNode.iter("att"):
+        attname = att.get("name")
+        _logger.debug(f"att name: {attname} val: {att.text}")
+        if attname in att_:
+            if attname in param_["attributes"]["keep"]["erddap"]:
+                # keep ERDDAP attributes
+                del att_[attname]
+            elif attname in param_["attributes"]["keep"]["icoscp"]:
+                # keep ICOS CP attributes
+                attrNode.remove(att)
+            elif attname in param_["attributes"]["keep"]["stats"]:
+                # keep attributes computed from csv columns (added last)
+                attrNode.remove(att)
+            else:
+                # append ERDDAP attributes with ICOS CP one
+                attrNode.remove(att)
+                att_[attname].append(att.text)
+
+    keys = att_.keys()
+    if sort_:
+        keys = sorted(keys, key=lambda x: x.lower())
+    for k in keys:
+        v = att_[k]
+        subnode = etree.SubElement(attrNode, "att", name=k)
+        subnode.text = ", ".join([str(x) for x in v])
+
+
 def changeAttr(ds, gloatt, out=None):
     """
     :param ds: str
        input filename
-    :param gloatt: dictionary
-       global and variable attribute to be added
+    :param gloatt: dictionary, or iterable of dictionaries
+       global and variable attribute to be added.
+       As iterable, global attributes could be given a batch of datasets at a time (see SuperICPObj.iterAttr).
+       variable attributes are added once every batch read.
     :param out: str
         output filename, optional
     """
     if not isinstance(ds, Path):
         ds = Path(ds)
 
-    if not isinstance(gloatt, dict):
-        raise TypeError(f"Invalid type value, gloatt -{gloatt}- must be dictionary")
+    if isinstance(gloatt, dict):
+        gloatt = [gloatt]
+    elif not hasattr(gloatt, "__iter__"):
+        raise TypeError(
+            f"Invalid type value, gloatt -{gloatt}- must be dictionary, or iterable of dictionaries"
+        )
 
     if out is not None and not isinstance(out, str):
         raise TypeError(f"Invalid type value, out -{out}- must be string")
@@ -343,38 +454,29 @@ def changeAttr(ds, gloatt, out=None):
     # check parameters file
     param = parameters.main()
 
-    # for node in list(root):
-    #    if node is not None:
+    # dataset nodes per datasetID
+    datasets = {}
     for node in root.findall("dataset"):
         _logger.debug(f"node: tag -{node.tag}- attribute -{node.attrib}-")
         if "datasetID" in node.attrib:
+            datasets.setdefault(node.attrib.get("datasetID"), []).append(node)
+
+    # variable attributes, added once every batch read
+    varatt = {}
+    for batch in gloatt:
+        if not isinstance(batch, dict):
+            raise TypeError(f"Invalid type value, gloatt -{batch}- must be dictionary")
 
-            dsID = node.attrib.get("datasetID")
-            if dsID in gloatt:
+        for dsID, att in batch.items():
+            if dsID in datasets:
                 _logger.debug(f"dsID: {dsID}")
-                for attrNode in node.findall("addAttributes"):
-                    _logger.debug(
-                        f"attrNode: tag -{attrNode.tag}- attribute -{attrNode.attrib}-"
-                    )
-                    for att in attrNode.iter("att"):
-                        attname = att.get("name")
-                        _logger.debug(f"att name: {attname} val: {att.text}")
-                        if attname in gloatt[dsID]:
-                            if attname in param["attributes"]["keep"]["erddap"]:
-                                # keep ERDDAP attributes
-                                del gloatt[dsID][attname]
-                            elif attname in param["attributes"]["keep"]["icoscp"]:
-                                # keep ICOS CP attributes
-                                attrNode.remove(att)
-                            else:
-                                # append ERDDAP attributes with ICOS CP one
-                                attrNode.remove(att)
-                                gloatt[dsID][attname].append(att.text)
-                    for k, v in gloatt[dsID].items():
-                        # for k, v in gloatt.items():
-                        subnode = etree.SubElement(attrNode, "att", name=k)
-                        subnode.text = ", ".join([str(x) for x in v])
+                for node in datasets[dsID]:
+                    for attrNode in node.findall("addAttributes"):
+                        _changeAttrNode(attrNode, att, param)
+            else:
+                varatt[dsID] = att
 
+    for node in root.findall("dataset"):
         for varNode in node.iter("dataVariable"):
             _logger.debug(f"varNode : tag -{varNode.tag}- attribute -{varNode.attrib}-")
             srcname = None
@@ -385,34 +487,11 @@ def changeAttr(ds, gloatt, out=None):
             # for attrNode in varNode.findall('destinationName'):
             #     dstname = attrnode.text
 
-            if srcname in gloatt:
+            if srcname in varatt:
                 for attrNode in varNode.findall("addAttributes"):
-                    _logger.debug(
-                        f"attrNode : tag -{attrNode.tag}- attribute -{attrNode.attrib}-"
-                    )
-                    for att in attrNode.iter("att"):
-                        attname = att.get("name")
-                        _logger.debug(f"att name: {attname} val: {att.text}")
-                        if attname in gloatt[srcname]:
-                            if attname in param["attributes"]["keep"]["erddap"]:
-                                # keep ERDDAP attributes
-                                del gloatt[srcname][attname]
-                            elif attname in param["attributes"]["keep"]["icoscp"]:
-                                # keep ICOS CP attributes
-                                attrNode.remove(att)
-                            else:
-                                # append ERDDAP attributes with ICOS CP one
-                                attrNode.remove(att)
-                                gloatt[srcname][attname].append(att.text)
-
-                    # for k, v in gloatt[srcname].items():
-                    sortedkeys = sorted(gloatt[srcname].keys(), key=lambda x: x.lower())
-                    for k in sortedkeys:
-                        v = gloatt[srcname][k]
-                        subnode = etree.SubElement(attrNode, "att", name=k)
-                        subnode.text = ", ".join([str(x) for x in v])
-
-            etree.indent(node)
+                    _changeAttrNode(attrNode, varatt[srcname], param, sort_=True)
+
+        etree.indent(node)
 
     # write xml output
     if out is not None:
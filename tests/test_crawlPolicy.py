@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# test_crawlPolicy.py
+
+"""Tests for `icp2edd.crawlPolicy` module."""
+
+# --- import -----------------------------------
+# import from standard lib
+import logging
+
+# import from other lib
+# import from my project
+from icp2edd.crawlPolicy import CrawlPolicy, list_rec_search
+
+
+# ----------------------------------------------
+def test_no_rule():
+    policy = CrawlPolicy()
+
+    assert policy.query("cpmeta.DataObject") == (None, set())
+    assert policy.follow("cpmeta.DataObject", "submission") == (True, ())
+
+
+def test_exclude_single_predicate():
+    policy = CrawlPolicy(
+        {"rules": {"cpmeta.DataObject": {"exclude": ["cpmeta:wasSubmittedBy"]}}}
+    )
+
+    assert policy.query("cpmeta.DataObject") == (None, {"cpmeta:wasSubmittedBy"})
+    assert policy.follow("cpmeta.DataObject", "submission", uri_="s") == (False, ())
+    assert policy.follow("cpmeta.DataObject", "acquisition") == (True, ())
+    assert policy.saved["cpmeta.DataObject exclude cpmeta:wasSubmittedBy"]["edge"] == 1
+
+
+def test_exclude_path_is_passed_to_object_pointed_to():
+    path = "cpmeta:wasSubmittedBy/prov:wasAssociatedWith"
+    policy = CrawlPolicy({"rules": {"cpmeta.DataObject": {"exclude": [path]}}})
+
+    # Note: only last predicate of the path is pruned
+    assert policy.query("cpmeta.DataObject") == (None, set())
+    follow, rules = policy.follow("cpmeta.DataObject", "submission")
+    assert follow is True
+    assert rules == ((f"cpmeta.DataObject exclude {path}", "exclude", ("prov:wasAssociatedWith",)),)
+    assert policy.follow("cpmeta.DataObject", "acquisition") == (True, ())
+
+
+def test_include():
+    policy = CrawlPolicy(
+        {"rules": {"cpmeta.DataObject": {"include": ["cpmeta:hasObjectSpec"]}}}
+    )
+
+    keep, prune = policy.query("cpmeta.DataObject")
+    assert keep == {"cpmeta:hasObjectSpec", "cpmeta:hasName", "cpmeta:hasColumnTitle"}
+    assert prune == set()
+    assert policy.follow("cpmeta.DataObject", "specification")[0] is True
+    assert policy.follow("cpmeta.DataObject", "submission")[0] is False
+
+
+def test_rules_apply_to_subclasses():
+    policy = CrawlPolicy(
+        {"rules": {"cpmeta.StaticObject": {"exclude": ["cpmeta:wasSubmittedBy"]}}}
+    )
+
+    assert policy.query("cpmeta.DataObject") == (None, {"cpmeta:wasSubmittedBy"})
+    assert policy.follow("cpmeta.DataObject", "submission")[0] is False
+
+
+def test_exclude_required_property_is_ignored(caplog):
+    crawl = {
+        "rules": {
+            "cpmeta.DataObject": {"exclude": ["cpmeta:hasName", "cpmeta:wasSubmittedBy"]},
+            "cpmeta.DatasetColumn": {"exclude": ["cpmeta:hasColumnTitle"]},
+        }
+    }
+    with caplog.at_level(logging.WARNING):
+        policy = CrawlPolicy(crawl)
+
+    assert policy.query("cpmeta.DataObject") == (None, {"cpmeta:wasSubmittedBy"})
+    assert policy.query("cpmeta.DatasetColumn") == (None, set())
+    assert "cpmeta:hasName" in caplog.text
+    assert "cpmeta:hasColumnTitle" in caplog.text
+
+
+def test_predicate_mode():
+    policy = CrawlPolicy({"predicates": {"station": "uri"}})
+
+    assert policy.predicate("station") == "uri"
+    assert policy.predicate("submission") == "follow"
+    assert all(policy.predicate(k) == "ignore" for k in list_rec_search)
+
+
+def test_depth():
+    policy = CrawlPolicy({"depth": 2})
+
+    assert policy.tooDeep(2) is False
+    assert policy.tooDeep(3, "uri") is True
+    assert policy.saved["depth 2"]["edge"] == 1
+
+
+def test_cycle_recorded_once_whatever_its_start():
+    policy = CrawlPolicy()
+
+    policy.cycle(["a", "b", "c", "a"], "next")
+    policy.cycle(["b", "c", "a", "b"], "next")
+
+    assert list(policy.cycles["next"]) == [("a", "b", "c")]
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# test_csv4Erddap.py
+
+"""Tests for `icp2edd.csv4Erddap` module."""
+
+# --- import -----------------------------------
+# import from standard lib
+import io
+import os
+import shutil
+
+# import from other lib
+import pytest
+
+# import from my project
+import icp2edd.csv4Erddap as c4edd
+
+# --- module's variable ------------------------
+_raw = (
+    "Date/Time [UTC],Latitude [deg N],fCO2 [uatm],Comment\n"
+    "2019-07-11T10:55:52Z,60.1,1.50,\n"
+    "2019-07-11T10:55:53.123456Z,60.2,NaN,\"with, comma\"\n"
+    ",60.3,,\"with \"\"quote\"\"\"\n"
+    "2019-07-11T10:56:00.5Z,60.4,1.5000,plain\n"
+)
+
+_modified = (
+    "Date/Time,Latitude,fCO2,Comment\n"
+    "2019-07-11T10:55:52.000Z,60.1,1.50,\n"
+    "2019-07-11T10:55:53.123Z,60.2,NaN,\"with, comma\"\n"
+    ",60.3,,\"with \"\"quote\"\"\"\n"
+    "2019-07-11T10:56:00.500Z,60.4,1.5000,plain\n"
+)
+
+engines = [
+    "pandas",
+    pytest.param(
+        "arrow",
+        marks=pytest.mark.skipif(c4edd.pa is None, reason="needs pyarrow"),
+    ),
+]
+
+
+# ----------------------------------------------
+@pytest.fixture
+def csvfile(tmp_path):
+    """raw csv file, as downloaded from ICOS CP"""
+    f = tmp_path / "file.csv"
+    f.write_text(_raw)
+    return f
+
+
+@pytest.mark.parametrize("engine", engines)
+@pytest.mark.parametrize("chunksize", [None, 1, 2])
+def test_modify(csvfile, engine, chunksize):
+    c4edd.modify(csvfile, chunksize_=chunksize, engine_=engine)
+
+    assert csvfile.read_text() == _modified
+    assert not list(csvfile.parent.glob("*.tmp"))
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_modify_keeps_hard_link(csvfile, engine):
+    # ex: file linked from data store
+    stored = csvfile.parent / "stored.csv"
+    shutil.copy(csvfile, stored)
+    csvfile.unlink()
+    os.link(stored, csvfile)
+
+    c4edd.modify(csvfile, engine_=engine)
+
+    assert csvfile.read_text() == _modified
+    assert stored.read_text() == _raw
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_modify_conform_changes_header_only(csvfile, engine):
+    csvfile.write_text(_modified.replace("Latitude", "Latitude [deg N]"))
+
+    sorted_ = c4edd.modify(csvfile, engine_=engine)
+
+    # Note: empty Date/Time is sorted last
+    assert csvfile.read_text() == _modified
+    assert sorted_ is False
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_modify_returns_order(csvfile, engine):
+    csvfile.write_text(_raw.replace("\n,60.3,,", "\n2019-07-11T10:55:59Z,60.3,,"))
+    assert c4edd.modify(csvfile, chunksize_=2, engine_=engine) is True
+
+    csvfile.write_text(_raw)
+    assert c4edd.modify(csvfile, chunksize_=2, engine_=engine) is False
+
+
+@pytest.mark.parametrize("engine", engines)
+def test_modify_stats(csvfile, engine):
+    c4edd.modify(csvfile, chunksize_=2, engine_=engine, stats_=True)
+
+    att = c4edd.datasetAttributes(csvfile.parent)
+    assert att["time_coverage_start"] == ["2019-07-11T10:55:52.000Z"]
+    assert att["time_coverage_end"] == ["2019-07-11T10:56:00.500Z"]
+    assert att["geospatial_lat_min"] == [60.1]
+    assert att["geospatial_lat_max"] == [60.4]
+
+
+def test_modify_engines_agree(tmp_path):
+    pytest.importorskip("pyarrow")
+    files = {}
+    for engine in ("pandas", "arrow"):
+        files[engine] = tmp_path / f"{engine}.csv"
+        header, rows = _raw.split("\n", 1)
+        files[engine].write_text(header + "\n" + rows * 50)
+        c4edd.modify(files[engine], chunksize_=7, engine_=engine)
+
+    assert files["pandas"].read_bytes() == files["arrow"].read_bytes()
+
+
+def test_modify_invalid_engine(csvfile):
+    with pytest.raises(ValueError):
+        c4edd.modify(csvfile, engine_="unknown")
+
+
+def test_modify_stream():
+    out = io.StringIO()
+    c4edd.modifyStream(io.StringIO(_raw), out)
+
+    assert out.getvalue() == _modified
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# test_downloader.py
+
+"""Tests for `icp2edd.downloader` module."""
+
+# --- import -----------------------------------
+# import from standard lib
+import hashlib
+import http.server
+import os
+import shutil
+import threading
+
+# import from other lib
+import pytest
+
+# import from my project
+from icp2edd.downloader import DataStore, Downloader, Job
+
+
+# ----------------------------------------------
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """serve server.data {pid: bytes}, answer Range request from server.offset if any"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.server.data.get(self.path.rsplit("/", 1)[-1])
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.server.requests.append(self.headers.get("Range"))
+        start = 0
+        if self.headers.get("Range") and self.server.ranges:
+            start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+            if self.server.offset is not None:
+                # Note: ignore byte requested
+                start = self.server.offset
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+
+@pytest.fixture
+def server():
+    """local HTTP server"""
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.data = {}
+    httpd.requests = []
+    httpd.ranges = True
+    httpd.offset = None
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _job(server_, dirout_, body_, pid_="pid", filename_="file.csv"):
+    """return job downloading body_ from server_ into dirout_"""
+    server_.data[pid_] = body_
+    dirout_.mkdir(parents=True, exist_ok=True)
+    uri = f"http://127.0.0.1:{server_.server_address[1]}/objects/{pid_}"
+    return Job(uri, filename_, dirout_, len(body_), hashlib.sha256(body_).hexdigest())
+
+
+def _modify(f_, text_):
+    """change file as csv4Erddap does: write a new file, then rename it"""
+    tmp = f_.parent / (f_.name + ".tmp")
+    tmp.write_text(text_)
+    os.replace(tmp, f_)
+
+
+# --- data store -------------------------------
+def test_store_ingest_link_and_reference(server, tmp_path):
+    body = b"Date/Time,x\n2019-07-11T10:55:52Z,1\n"
+    job = _job(server, tmp_path / "csv" / "ds", body)
+    store = DataStore(tmp_path / "store")
+
+    Downloader(1, tmp_path / "store").run([job])
+
+    assert job.fileout.read_bytes() == body
+    assert os.path.samefile(store.path(job.key), job.fileout)
+    assert DataStore.reference(job.fileout).read_text() == job.key
+
+
+def test_store_keeps_referenced_file_once_modified(server, tmp_path):
+    body = b"Date/Time,x\n2019-07-11T10:55:52Z,1\n"
+    job = _job(server, tmp_path / "csv" / "ds", body)
+    store = DataStore(tmp_path / "store")
+    Downloader(1, tmp_path / "store").run([job])
+
+    _modify(job.fileout, "Date/Time,x\n2019-07-11T10:55:52.000Z,1\n")
+    assert store.evict(tmp_path / "csv") == 0
+    assert store.path(job.key).read_bytes() == body
+
+    # next run reuses the original content, without downloading it
+    server.requests.clear()
+    Downloader(1, tmp_path / "store").run([job])
+    assert server.requests == []
+    assert job.fileout.read_bytes() == body
+
+
+def test_store_evicts_unreferenced_files(server, tmp_path):
+    old = _job(server, tmp_path / "csv" / "old", b"old\n", "old")
+    new = _job(server, tmp_path / "csv" / "new", b"new\n", "new")
+    store = DataStore(tmp_path / "store")
+    Downloader(1, tmp_path / "store").run([old, new])
+
+    # ex: dataset directory retired
+    shutil.rmtree(old.dirout)
+    assert store.evict(tmp_path / "csv") == len(b"old\n")
+    assert not store.has(old.key)
+    assert store.has(new.key)
+
+
+def test_store_evicts_previous_content(server, tmp_path):
+    store = DataStore(tmp_path / "store")
+    first = _job(server, tmp_path / "csv" / "ds", b"first\n")
+    Downloader(1, tmp_path / "store").run([first])
+
+    # same file downloaded again with another content
+    first.fileout.unlink()
+    second = _job(server, tmp_path / "csv" / "ds", b"second\n")
+    Downloader(1, tmp_path / "store").run([second])
+
+    store.evict(tmp_path / "csv")
+    assert not store.has(first.key)
+    assert store.has(second.key)
+
+
+def test_store_ingest_same_content_concurrently(tmp_path):
+    store = DataStore(tmp_path / "store")
+    files = []
+    for i in range(8):
+        f = tmp_path / "csv" / f"ds{i}" / "file.csv"
+        f.parent.mkdir(parents=True)
+        f.write_bytes(b"same\n")
+        files.append(f)
+    key = hashlib.sha256(b"same\n").hexdigest()
+
+    threads = [threading.Thread(target=store.ingest, args=(f, key)) for f in files]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(os.path.samefile(store.path(key), f) for f in files)
+    assert not list((tmp_path / "store").glob("**/*.link"))
+
+
+# --- Range resume -----------------------------
+def _partial(job_, body_, offset_):
+    """write partial file of body_, as left by an interrupted download"""
+    job_.part.write_bytes(body_[:offset_])
+    job_.writeJournal()
+
+
+def test_resume_from_partial_file(server, tmp_path):
+    body = os.urandom(100000)
+    job = _job(server, tmp_path / "csv" / "ds", body)
+    _partial(job, body, 12345)
+
+    Downloader(1).run([job])
+
+    assert server.requests == ["bytes=12345-"]
+    assert job.fileout.read_bytes() == body
+    assert not job.part.exists()
+    assert not job.journal.exists()
+
+
+def test_resume_without_range_support(server, tmp_path):
+    body = os.urandom(100000)
+    job = _job(server, tmp_path / "csv" / "ds", body)
+    _partial(job, body, 12345)
+    server.ranges = False
+
+    Downloader(1).run([job])
+
+    assert job.fileout.read_bytes() == body
+
+
+def test_resume_with_unexpected_content_range(server, tmp_path):
+    body = os.urandom(100000)
+    job = _job(server, tmp_path / "csv" / "ds", body)
+    _partial(job, body, 12345)
+    server.offset = 100
+
+    Downloader(1).run([job])
+
+    # whole file downloaded again
+    assert server.requests == ["bytes=12345-", None]
+    assert job.fileout.read_bytes() == body
+
+
+def test_resume_ignores_partial_file_of_another_object(server, tmp_path):
+    body = os.urandom(100000)
+    job = _job(server, tmp_path / "csv" / "ds", body)
+    _partial(job, body, 12345)
+    other = _job(server, tmp_path / "csv" / "ds", os.urandom(100000), "other")
+
+    Downloader(1).run([other])
+
+    assert server.requests == [None]
+    assert other.fileout.read_bytes() == server.data["other"]
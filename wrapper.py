@@ -8,6 +8,7 @@ import time
 # import from other lib
 # import from my project
 import icp2edd
+import icp2edd.session as session
 from icp2edd.__main__ import main
 from icp2edd.checkOntology import main as check
 
@@ -16,7 +17,12 @@ if __name__ == '__main__':
     print('package: {}'.format(icp2edd.__package__))
     print('version: {}'.format(icp2edd.__version__))
 
-    # run icp2edd
-    main()
-    # check ontology ...
-    # check()
+    # share metadata read from ICOS CP between icp2edd and check ontology
+    session.start()
+    try:
+        # run icp2edd
+        main()
+        # check ontology, reuse metadata read by icp2edd
+        check()
+    finally:
+        session.stop()